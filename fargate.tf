@@ -118,7 +118,13 @@ resource "aws_iam_policy" "fargate_policy" {
         Resource = "*" # Simplified for demo
       },
       {
-        Action = ["dynamodb:Query", "dynamodb:GetItem"],
+        # INFERENCE_MODE=local loads the model artifact itself
+        Action = ["s3:GetObject"],
+        Effect = "Allow",
+        Resource = "${aws_s3_bucket.data_lake.arn}/models/*"
+      },
+      {
+        Action = ["dynamodb:Query", "dynamodb:GetItem", "dynamodb:BatchGetItem"],
         Effect = "Allow",
         Resource = aws_dynamodb_table.aggregates.arn
       }
@@ -147,7 +153,9 @@ resource "aws_ecs_task_definition" "backend_task" {
       { name = "SAGEMAKER_ENDPOINT", value = aws_sagemaker_endpoint.endpoint.name },
       { name = "DYNAMO_TABLE", value = aws_dynamodb_table.aggregates.name },
       { name = "DB_HOST", value = aws_db_instance.user_db.address },
-      { name = "DB_PASS", value = random_password.db_password.result }
+      { name = "DB_PASS", value = random_password.db_password.result },
+      { name = "DB_REPLICA_HOSTS", value = join(",", aws_db_instance.user_db_replica[*].address) },
+      { name = "STREAM_PUSH_TOKEN", value = random_password.stream_push_token.result }
     ]
     logConfiguration = {
         logDriver = "awslogs"
@@ -179,8 +187,12 @@ resource "aws_lb_target_group" "tg" {
   protocol    = "HTTP"
   target_type = "ip"
   vpc_id      = aws_vpc.main.id
+  # Tasks only get traffic once every worker has warmed up (pool, model, caches)
   health_check {
-    path = "/health"
+    path                = "/ready"
+    interval            = 10
+    healthy_threshold   = 2
+    unhealthy_threshold = 3
   }
 }
 
@@ -201,6 +213,8 @@ resource "aws_ecs_service" "backend_service" {
   task_definition = aws_ecs_task_definition.backend_task.arn
   desired_count   = 1
   launch_type     = "FARGATE"
+  # Warm-up (first SageMaker call may be a cold start) must not count as failing
+  health_check_grace_period_seconds = 180
 
   network_configuration {
     subnets          = [aws_subnet.public_1.id, aws_subnet.public_2.id]
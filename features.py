@@ -0,0 +1,118 @@
+import numpy as np
+
+# Feature pipeline shared by the offline training job (scripts/train_model.py)
+# and the model container (packaged next to inference.py by setup_model.py),
+# so both turn raw fields into the model matrix with the same code.
+#
+# Input is columnar: {field: sequence of values}, one entry per row. Raw fields:
+#   form:       sleep_duration, stress_level, screen_time, exercise_frequency,
+#               caffeine_intake, reaction_time, memory_test_score
+#   wearables:  heart_rate, steps, calories, hr_recent (last readings, oldest first)
+#   profile:    date_of_birth (users.date_of_birth, 'YYYY-MM-DD')
+
+# Categorical lookup tables: category -> code, unknown or missing -> 0
+EXERCISE_LEVELS = {'None': 0, 'Light': 1, 'Moderate': 2, 'Heavy': 3}
+LOOKUP_TABLES = {'exercise_frequency': EXERCISE_LEVELS}
+
+# Numeric fields used as they are; missing values become the default
+NUMERIC_DEFAULTS = {
+    'sleep_duration': 7.0, 'stress_level': 5.0, 'screen_time': 4.0, 'caffeine_intake': 0.0,
+    'reaction_time': 300.0, 'memory_test_score': 50.0, 'heart_rate': 0.0, 'steps': 0.0, 'calories': 0.0,
+}
+# Used when the date of birth is unknown
+DEFAULT_AGE = 40.0
+
+# Heart-rate readings the rolling stats look back over (the stream processor
+# keeps this many per user in the 'latest state' item)
+HR_WINDOW = 12
+
+# Columns of the model matrix, in order
+FEATURE_COLUMNS = [
+    'sleep_duration', 'stress_level', 'screen_time', 'exercise_frequency', 'caffeine_intake',
+    'reaction_time', 'memory_test_score', 'heart_rate', 'steps', 'calories',
+    'age', 'hr_mean', 'hr_std',
+]
+
+SECONDS_PER_YEAR = 365.25 * 24 * 3600
+
+
+def encode_category(values, table):
+    """Codes of a whole column; the table is looked up once per distinct value."""
+    names, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    return np.array([table.get(name, 0) for name in names], dtype=np.float64)[inverse]
+
+
+def numeric(values, default):
+    """Float column; None and NaN become `default`."""
+    column = np.asarray(values, dtype=np.float64)
+    return np.where(np.isnan(column), default, column)
+
+
+def age_years(date_of_birth, as_of=None):
+    """Age at `as_of` (datetimes, default now); unknown birth dates get DEFAULT_AGE."""
+    born = np.asarray(date_of_birth, dtype='datetime64[s]')
+    at = np.datetime64('now', 's') if as_of is None else np.asarray(as_of, dtype='datetime64[s]')
+    age = (at - born).astype(np.float64) / SECONDS_PER_YEAR
+    return np.where(np.isnat(born), DEFAULT_AGE, age)
+
+
+def window_matrix(sequences, width=HR_WINDOW):
+    """(rows, width) matrix of each sequence's last `width` values, NaN-padded on the left."""
+    matrix = np.full((len(sequences), width), np.nan)
+    for i, seq in enumerate(sequences):
+        if seq:
+            tail = seq[-width:]
+            matrix[i, width - len(tail):] = tail
+    return matrix
+
+
+def trailing_windows(times, values, at, width=HR_WINDOW):
+    """Last `width` readings at or before each time in `at`, for one user.
+
+    `times` must be sorted. Returns the same NaN-padded matrix as
+    window_matrix(), built with one searchsorted and a strided view.
+    """
+    padded = np.concatenate([np.full(width, np.nan), np.asarray(values, dtype=np.float64)])
+    windows = np.lib.stride_tricks.sliding_window_view(padded, width)
+    ends = np.searchsorted(times, at, side='right')
+    return windows[ends]
+
+
+def window_stats(windows, fallback):
+    """Mean and standard deviation per row, ignoring NaN padding.
+
+    Rows without any reading use `fallback` (e.g. the current heart rate)
+    as mean and 0 as standard deviation.
+    """
+    present = ~np.isnan(windows)
+    counts = present.sum(axis=1)
+    filled = np.where(present, windows, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = filled.sum(axis=1) / counts
+        deviations = np.where(present, windows - mean[:, None], 0.0)
+        std = np.sqrt((deviations ** 2).sum(axis=1) / counts)
+    has_data = counts > 0
+    return np.where(has_data, mean, fallback), np.where(has_data, std, 0.0)
+
+
+def build_matrix(columns, n, as_of=None, hr_windows=None):
+    """Model matrix (n, len(FEATURE_COLUMNS)) from raw columns.
+
+    `hr_windows` may be passed precomputed (training uses trailing_windows());
+    otherwise it is built from the 'hr_recent' column.
+    """
+    X = np.empty((n, len(FEATURE_COLUMNS)))
+    for j, name in enumerate(FEATURE_COLUMNS):
+        if name in NUMERIC_DEFAULTS:
+            values = columns.get(name)
+            X[:, j] = NUMERIC_DEFAULTS[name] if values is None else numeric(values, NUMERIC_DEFAULTS[name])
+        elif name in LOOKUP_TABLES:
+            values = columns.get(name)
+            X[:, j] = 0.0 if values is None else encode_category(values, LOOKUP_TABLES[name])
+    dob = columns.get('date_of_birth')
+    X[:, FEATURE_COLUMNS.index('age')] = DEFAULT_AGE if dob is None else age_years(dob, as_of)
+    if hr_windows is None:
+        hr_windows = window_matrix(columns.get('hr_recent') or [None] * n)
+    heart_rate = X[:, FEATURE_COLUMNS.index('heart_rate')]
+    X[:, FEATURE_COLUMNS.index('hr_mean')], X[:, FEATURE_COLUMNS.index('hr_std')] = window_stats(hr_windows, heart_rate)
+    return X
@@ -46,7 +46,8 @@ resource "aws_iam_policy" "processor_policy" {
       },
       {
         # WRITE to DynamoDB
-        Action = ["dynamodb:PutItem", "dynamodb:UpdateItem"]
+        # BatchGetItem reads the stored heart-rate windows (hr_recent) before each update
+        Action = ["dynamodb:PutItem", "dynamodb:UpdateItem", "dynamodb:BatchGetItem"]
         Effect = "Allow"
         Resource = aws_dynamodb_table.aggregates.arn
       }
@@ -59,6 +60,12 @@ resource "aws_iam_role_policy_attachment" "proc_attach" {
   policy_arn = aws_iam_policy.processor_policy.arn
 }
 
+# Shared secret of the pulse push to the backend ('/api/stream/pulses')
+resource "random_password" "stream_push_token" {
+  length  = 32
+  special = false
+}
+
 # 4. The Lambda Function
 resource "aws_lambda_function" "stream_processor" {
   filename         = "stream_processor.zip"
@@ -70,7 +77,9 @@ resource "aws_lambda_function" "stream_processor" {
 
   environment {
     variables = {
-      DYNAMO_TABLE = aws_dynamodb_table.aggregates.name
+      DYNAMO_TABLE      = aws_dynamodb_table.aggregates.name
+      BACKEND_PUSH_URL  = "http://${aws_lb.alb.dns_name}/api/stream/pulses"
+      STREAM_PUSH_TOKEN = random_password.stream_push_token.result
     }
   }
 }
@@ -98,11 +98,37 @@ resource "aws_db_instance" "user_db" {
   publicly_accessible    = true # Set to true so you can run the loader script from your laptop
   skip_final_snapshot    = true
   vpc_security_group_ids = [aws_security_group.db_sg.id]
+  # Read replicas need automated backups on the source
+  backup_retention_period = var.db_replica_count > 0 ? 1 : 0
 
   # Security: Enforce SSL
   parameter_group_name = "default.postgres16"
 }
 
+resource "aws_db_instance" "user_db_replica" {
+  count                  = var.db_replica_count
+  identifier             = "${var.project_name}-user-db-replica-${count.index}"
+  replicate_source_db    = aws_db_instance.user_db.identifier
+  instance_class         = "db.t3.micro"
+  publicly_accessible    = true
+  skip_final_snapshot    = true
+  vpc_security_group_ids = [aws_security_group.db_sg.id]
+  parameter_group_name   = aws_db_parameter_group.user_db_replica.name
+}
+
+# The backend treats a replica as lagging when it has not heard from the primary
+# for REPLICA_MAX_LAG_SECONDS; make it ping an idle primary well within that
+resource "aws_db_parameter_group" "user_db_replica" {
+  name   = "${var.project_name}-user-db-replica"
+  family = "postgres16"
+
+  parameter {
+    name         = "wal_receiver_timeout"
+    value        = "4000" # ms; the standby pings after half of it without traffic
+    apply_method = "immediate"
+  }
+}
+
 
 # --- API GATEWAY (HTTP API) ---
 resource "aws_apigatewayv2_api" "api" {
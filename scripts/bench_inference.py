@@ -0,0 +1,78 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+from bench_predict import generate_predict_request, report
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "backend"))
+from local_model import LocalModel
+
+# Compares the two inference paths of the backend on the same model artifact:
+# remote (invoke_endpoint against scripts/fake_sagemaker.py) vs local process pool.
+
+def model_input():
+    features = {'heart_rate': random.randint(60, 130), 'steps': random.randint(0, 20), 'calories': 3}
+    features.update(generate_predict_request("bench_user"))
+    return json.dumps(features)
+
+def run(label, call, requests, concurrency):
+    for _ in range(10):
+        call(model_input())
+
+    def timed(_):
+        start = time.perf_counter()
+        try:
+            call(model_input())
+            return True, (time.perf_counter() - start) * 1000
+        except Exception:
+            return False, 0.0
+
+    latencies_ms, errors = [], 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for ok, ms in pool.map(timed, range(requests)):
+            if ok:
+                latencies_ms.append(ms)
+            else:
+                errors += 1
+    report(label, latencies_ms, errors, time.perf_counter() - start)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Remote vs local inference latency")
+    parser.add_argument('--model', type=str, default="model.tar.gz",
+                        help="Model artifact used by the local path (same one the fake endpoint serves).")
+    parser.add_argument('--endpoint-url', type=str, default="http://localhost:8080",
+                        help="Stand-in endpoint started with scripts/fake_sagemaker.py (default: %(default)s).")
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=8)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    # The fake endpoint does not check signatures, but botocore wants credentials
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+
+    client = boto3.client('sagemaker-runtime', region_name='us-east-1', endpoint_url=args.endpoint_url)
+
+    def remote(body):
+        resp = client.invoke_endpoint(EndpointName='bench', ContentType='application/json', Body=body)
+        return resp['Body'].read()
+
+    run("remote (fake endpoint)", remote, args.requests, args.concurrency)
+
+    local = LocalModel(os.path.abspath(args.model), work_dir='/tmp/cpms_bench_model')
+    local.reload_if_changed()
+    try:
+        run("local (process pool)", local.invoke, args.requests, args.concurrency)
+    finally:
+        local.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import io
+import json
+import random
+import time
+
+import numpy as np
+
+from bench_predict import generate_predict_request
+from fake_sagemaker import load_handler
+
+# Rows/sec of the packaged model (input_fn -> predict_fn -> output_fn, no network)
+# for one call per row vs one batched call in each payload format.
+
+BATCH_SIZES = (1, 32, 256, 4096)
+
+def feature_row():
+    row = generate_predict_request("bench_user")
+    row.update(heart_rate=random.randint(60, 130), steps=random.randint(0, 20), calories=3)
+    return row
+
+def payloads(handler, rows):
+    """(label, content_type, body) of the same rows in each accepted format."""
+    columns = {name: [row[name] for row in rows] for name in rows[0]}
+    matrix = handler.input_fn(json.dumps(rows), 'application/json')['X']
+    npy = io.BytesIO()
+    np.save(npy, matrix)
+    return [
+        ("json rows", 'application/json', json.dumps(rows)),
+        ("json columns", 'application/json', json.dumps(columns)),
+        ("npy", handler.NPY_CONTENT_TYPE, npy.getvalue()),
+    ]
+
+def rows_per_sec(fn, rows, min_seconds):
+    calls, start = 0, time.perf_counter()
+    while True:
+        fn()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return calls * rows / elapsed
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Packaged model throughput per batch size")
+    parser.add_argument('--model', type=str, default="model.tar.gz",
+                        help="Model artifact (create one with setup_model.create_dummy_model()).")
+    parser.add_argument('--seconds', type=float, default=1.0,
+                        help="Minimum time per measurement (default: %(default)s).")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    handler, model = load_handler(args.model)
+
+    def invoke(body, content_type):
+        return handler.output_fn(handler.predict_fn(handler.input_fn(body, content_type), model), 'application/json')
+
+    print(f"{'batch':>6} {'format':<16} {'rows/sec':>12}")
+    for size in BATCH_SIZES:
+        rows = [feature_row() for _ in range(size)]
+        single = [json.dumps(row) for row in rows]
+
+        def one_call_per_row():
+            for body in single:
+                invoke(body, 'application/json')
+
+        print(f"{size:>6} {'per-row calls':<16} {rows_per_sec(one_call_per_row, size, args.seconds):>12,.0f}")
+        for label, content_type, body in payloads(handler, rows):
+            rate = rows_per_sec(lambda: invoke(body, content_type), size, args.seconds)
+            print(f"{size:>6} {label:<16} {rate:>12,.0f}")
+
+if __name__ == "__main__":
+    main()
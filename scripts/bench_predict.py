@@ -0,0 +1,91 @@
+import requests
+import time
+import random
+import csv
+import os
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+
+# --- CONFIGURATION ---
+PREDICT_URL = os.getenv("PREDICT_URL")
+
+def load_users(filename=os.path.join(DATA_DIR, 'users.csv')):
+    with open(filename, 'r') as f:
+        return [row['userId'] for row in csv.DictReader(f)]
+
+def generate_predict_request(user_id):
+    """Full PredictRequest body as expected by /api/predict"""
+    return {
+        "user_id": user_id,
+        "sleep_duration": round(random.uniform(4.0, 9.0), 1),
+        "stress_level": random.randint(1, 10),
+        "screen_time": round(random.uniform(1.0, 12.0), 1),
+        "exercise_frequency": random.choice(['None', 'Light', 'Moderate', 'Heavy']),
+        "caffeine_intake": random.choice([0, 100, 200]),
+        "reaction_time": round(random.uniform(200, 600), 1),
+        "memory_test_score": random.randint(0, 100),
+    }
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+def report(label, latencies_ms, errors, elapsed):
+    latencies_ms.sort()
+    print(f"{label}: {len(latencies_ms)} ok, {errors} errors in {elapsed:.1f}s "
+          f"({len(latencies_ms) / elapsed:.1f} req/s)")
+    print(f"  p50={percentile(latencies_ms, 50):.1f}ms "
+          f"p95={percentile(latencies_ms, 95):.1f}ms "
+          f"p99={percentile(latencies_ms, 99):.1f}ms "
+          f"max={latencies_ms[-1] if latencies_ms else 0:.1f}ms")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="CPMS /api/predict latency benchmark")
+    parser.add_argument('--url', type=str, default=PREDICT_URL,
+                        help="Prediction URL, e.g. http://<backend_url>/api/predict (default: PREDICT_URL).")
+    parser.add_argument('--requests', type=int, default=500,
+                        help="Total number of requests (default: %(default)s).")
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help="Number of concurrent clients (default: %(default)s).")
+    parser.add_argument('--label', type=str, default="predict",
+                        help="Label printed with the results, e.g. 'write-behind on'.")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if not args.url:
+        print("ERROR: PREDICT_URL not set. Set it in your .env or pass --url.")
+        return
+
+    users = load_users()
+    session = requests.Session()
+    latencies_ms = []
+    errors = 0
+
+    def one_call(_):
+        body = generate_predict_request(random.choice(users))
+        start = time.perf_counter()
+        resp = session.post(args.url, json=body)
+        return resp.status_code, (time.perf_counter() - start) * 1000
+
+    # Warm up connections and the model endpoint before measuring
+    for _ in range(min(10, args.requests)):
+        one_call(None)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for status, ms in pool.map(one_call, range(args.requests)):
+            if status == 200:
+                latencies_ms.append(ms)
+            else:
+                errors += 1
+    report(args.label, latencies_ms, errors, time.perf_counter() - start)
+
+if __name__ == "__main__":
+    main()
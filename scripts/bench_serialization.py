@@ -0,0 +1,92 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import timeit
+from decimal import Decimal
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from bench_predict import generate_predict_request
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "backend"))
+from main import PredictRequest, build_model_input
+from serialization import FastJSONResponse, dumps, loads
+
+# CPU spent per /api/predict on building the model input and (de)serializing,
+# before and after the lean path. Network, DynamoDB and the model are left out.
+
+# 'latest state' item as boto3 returns it (numbers are Decimals)
+ITEM = {
+    'user_id': 'bench_user',
+    'timestamp': '2024-05-01T08:00:00.000000',
+    'heart_rate': Decimal('72'),
+    'steps': Decimal('14'),
+    'calories': Decimal('3.5'),
+}
+MODEL_RESPONSE = json.dumps({'cognitive_score': 73, 'model_version': 'v1-mock'})
+
+
+def old_stages(req):
+    def build():
+        model_input = ITEM.copy()
+        model_input.update(req.dict())
+        return model_input
+
+    model_input = build()
+    response = {"user_id": req.user_id, "score": 73, "status": "Normal"}
+    return {
+        "build input": build,
+        "fingerprint": lambda: hashlib.blake2b(
+            json.dumps(['v1', model_input], sort_keys=True, default=str).encode(), digest_size=16).hexdigest(),
+        "encode input": lambda: json.dumps(model_input, default=str),
+        "decode result": lambda: json.loads(MODEL_RESPONSE),
+        "render response": lambda: JSONResponse(jsonable_encoder(response)).body,
+    }
+
+
+def new_stages(req):
+    model_input = build_model_input(ITEM, req)
+    response = {"user_id": req.user_id, "score": 73, "status": "Normal"}
+    model_response = MODEL_RESPONSE.encode()
+    return {
+        "build input": lambda: build_model_input(ITEM, req),
+        "fingerprint": lambda: hashlib.blake2b(
+            dumps(['v1', model_input], sort_keys=True), digest_size=16).hexdigest(),
+        "encode input": lambda: dumps(model_input),
+        "decode result": lambda: loads(model_response),
+        "render response": lambda: FastJSONResponse(response).body,
+    }
+
+
+def measure(fn, number, repeat):
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e6
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Per-request serialization CPU, old vs lean path")
+    parser.add_argument('--number', type=int, default=20000, help="Calls per timing run (default: %(default)s).")
+    parser.add_argument('--repeat', type=int, default=5, help="Timing runs, best one counts (default: %(default)s).")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    req = PredictRequest(**generate_predict_request("bench_user"))
+    old, new = old_stages(req), new_stages(req)
+
+    print(f"{'stage':<16} {'old (us)':>10} {'new (us)':>10} {'saved':>8}")
+    old_total = new_total = 0.0
+    for stage in old:
+        before = measure(old[stage], args.number, args.repeat)
+        after = measure(new[stage], args.number, args.repeat)
+        old_total += before
+        new_total += after
+        print(f"{stage:<16} {before:>10.2f} {after:>10.2f} {1 - after / before:>8.0%}")
+    print(f"{'total':<16} {old_total:>10.2f} {new_total:>10.2f} {1 - new_total / old_total:>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
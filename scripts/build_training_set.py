@@ -0,0 +1,302 @@
+import argparse
+import csv
+import heapq
+import json
+import os
+import shutil
+import sys
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import boto3
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import features
+
+load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
+
+# Builds the offline training set from the cold path: raw wearable events
+# archived by the ingestion Lambda (s3://<bucket>/raw/<event_id>.json, or a
+# local copy) joined with the cognitive_scores labels and users attributes.
+# Every label gets the user's last reading and last HR readings at or before
+# its timestamp (point in time, nothing from the future).
+#
+# Memory stays bounded however large the archive is:
+#   1. events are read in chunks, sorted by (user_id, timestamp) and spilled
+#      as sorted runs (external sort);
+#   2. labels and users are COPY'd to local files, sorted by Postgres;
+#   3. one pass merges the runs and joins all three sorted streams.
+# The result is a directory with one .npy file per column (load with
+# mmap_mode='r'), read by 'python scripts/train_model.py --training-set <dir>'.
+
+# --- CONFIGURATION ---
+
+DB_HOST = os.getenv("DB_HOST")
+DB_NAME = os.getenv("DB_NAME")
+DB_USER = os.getenv("DB_USER")
+DB_PASS = os.getenv("DB_PASS")
+SSL_MODE = os.getenv("SSL_MODE", "require")
+BUCKET_NAME = os.getenv("BUCKET_NAME")
+RAW_PREFIX = "raw/"
+
+# COLLATE "C" sorts user ids byte-wise, the same order as Python bytes
+LABELS_QUERY = """
+    SELECT user_id, extract(epoch FROM timestamp)::BIGINT, cognitive_score
+    FROM cognitive_scores
+    WHERE user_id IS NOT NULL AND cognitive_score IS NOT NULL
+    ORDER BY user_id COLLATE "C", timestamp
+"""
+USERS_QUERY = 'SELECT user_id, date_of_birth FROM users ORDER BY user_id COLLATE "C"'
+
+EVENT_DTYPE = np.dtype([
+    ('user_id', 'S64'), ('timestamp', 'i8'), ('heart_rate', 'f8'), ('steps', 'f8'), ('calories', 'f8'),
+])
+# Columns of the training set; NaN / NaT where nothing is known at label time
+ROW_DTYPE = np.dtype([
+    ('label_time', 'M8[s]'), ('cognitive_score', 'f8'),
+    ('heart_rate', 'f8'), ('steps', 'f8'), ('calories', 'f8'),
+    ('hr_window', 'f8', (features.HR_WINDOW,)), ('date_of_birth', 'M8[D]'),
+])
+
+
+class NpyWriter:
+    """Appends blocks to a .npy file whose length is only known when it is closed."""
+
+    def __init__(self, path, dtype, shape=()):
+        self.path, self.dtype, self.shape, self.rows = path, np.dtype(dtype), tuple(shape), 0
+        self._data = open(path + ".part", "wb")
+
+    def append(self, block):
+        np.ascontiguousarray(block, dtype=self.dtype).tofile(self._data)
+        self.rows += len(block)
+
+    def close(self):
+        self._data.close()
+        header = {'descr': np.lib.format.dtype_to_descr(self.dtype), 'fortran_order': False,
+                  'shape': (self.rows,) + self.shape}
+        with open(self.path, "wb") as out, open(self.path + ".part", "rb") as data:
+            np.lib.format.write_array_header_1_0(out, header)
+            shutil.copyfileobj(data, out, 1 << 20)
+        os.remove(self.path + ".part")
+
+
+# --- RAW EVENTS ---
+
+def local_events(path):
+    """Events of a local archive: one event per .json file, or one per line in .jsonl files."""
+    for root, _, files in os.walk(path):
+        for name in sorted(files):
+            full = os.path.join(root, name)
+            if name.endswith(".json"):
+                with open(full) as f:
+                    yield json.load(f)
+            elif name.endswith(".jsonl"):
+                with open(full) as f:
+                    for line in f:
+                        if line.strip():
+                            yield json.loads(line)
+
+def s3_events(bucket, prefix, threads):
+    """Events of the S3 archive, fetched `threads` objects at a time."""
+    s3 = boto3.client('s3')
+    pages = s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix)
+    keys = (obj['Key'] for page in pages for obj in page.get('Contents', []))
+
+    def fetch(key):
+        return json.loads(s3.get_object(Bucket=bucket, Key=key)['Body'].read())
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        while True:
+            batch = list(islice(keys, threads * 16))
+            if not batch:
+                return
+            yield from pool.map(fetch, batch)
+
+def parse_time(value):
+    """Epoch seconds of an event timestamp (epoch string from the ingestion Lambda, or ISO)."""
+    try:
+        return int(float(value))
+    except ValueError:
+        return int(np.datetime64(value, 's').astype(np.int64))
+
+def event_row(event):
+    """EVENT_DTYPE fields of a wearable event; None for other events."""
+    if not event.get('user_id') or event.get('heart_rate') is None or event.get('timestamp') is None:
+        return None
+    return (event['user_id'].encode(), parse_time(event['timestamp']), float(event['heart_rate']),
+            float(event.get('steps') or 0), float(event.get('calories') or 0))
+
+def write_sorted_runs(events, chunk_rows, tmp_dir):
+    """Sorts the events in chunks of `chunk_rows` and spills each chunk as a run file."""
+    paths, chunk, n, skipped = [], np.empty(chunk_rows, dtype=EVENT_DTYPE), 0, 0
+
+    def spill(rows):
+        rows = rows[np.lexsort((rows['timestamp'], rows['user_id']))]
+        path = os.path.join(tmp_dir, f"run-{len(paths):06d}.npy")
+        np.save(path, rows)
+        paths.append(path)
+
+    for event in events:
+        try:
+            row = event_row(event)
+        except (TypeError, ValueError, AttributeError):
+            row = None
+        if row is None:
+            skipped += 1
+            continue
+        chunk[n] = row
+        n += 1
+        if n == chunk_rows:
+            spill(chunk)
+            n = 0
+    if n:
+        spill(chunk[:n])
+    print(f"Sorted events into {len(paths)} runs ({skipped} non-wearable or invalid events skipped)")
+    return paths
+
+def read_run(path, block_rows):
+    run = np.load(path, mmap_mode='r')
+    for start in range(0, len(run), block_rows):
+        yield from run[start:start + block_rows].tolist()
+
+def merged_events(paths, block_rows, fan_in, tmp_dir):
+    """All events in (user_id, timestamp) order.
+
+    More than `fan_in` runs are first merged in groups, so the number of
+    open files stays bounded.
+    """
+    level = 0
+    while len(paths) > fan_in:
+        merged = []
+        for i in range(0, len(paths), fan_in):
+            writer = NpyWriter(os.path.join(tmp_dir, f"merge-{level}-{i // fan_in:06d}.npy"), EVENT_DTYPE)
+            block = []
+            for row in heapq.merge(*(read_run(p, block_rows) for p in paths[i:i + fan_in])):
+                block.append(row)
+                if len(block) == block_rows:
+                    writer.append(np.array(block, dtype=EVENT_DTYPE))
+                    block = []
+            writer.append(np.array(block, dtype=EVENT_DTYPE))
+            writer.close()
+            merged.append(writer.path)
+            for p in paths[i:i + fan_in]:
+                os.remove(p)
+        paths, level = merged, level + 1
+    return heapq.merge(*(read_run(p, block_rows) for p in paths))
+
+
+# --- USERDB ---
+
+def copy_to_file(cursor, query, path):
+    """Server-side COPY of a query into a local CSV file."""
+    with open(path, "w") as f:
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT CSV)", f)
+
+def read_labels(path):
+    with open(path, newline='') as f:
+        for user_id, ts, score in csv.reader(f):
+            yield user_id.encode(), int(ts), float(score)
+
+def read_users(path):
+    with open(path, newline='') as f:
+        for user_id, date_of_birth in csv.reader(f):
+            yield user_id.encode(), date_of_birth or None
+
+
+# --- JOIN ---
+
+def join(labels, events, users, out_dir, block_rows):
+    """Merge join of the three sorted streams into the training set columns.
+
+    Events are consumed up to each label's (user_id, timestamp), so a row
+    only sees readings at or before its label.
+    """
+    writers = {name: NpyWriter(os.path.join(out_dir, f"{name}.npy"), ROW_DTYPE[name].base, ROW_DTYPE[name].shape)
+               for name in ROW_DTYPE.names}
+    block, n = np.empty(block_rows, dtype=ROW_DTYPE), 0
+
+    def flush(rows):
+        for name, writer in writers.items():
+            writer.append(rows[name])
+
+    event, user = next(events, None), next(users, None)
+    current, latest, window = None, None, deque(maxlen=features.HR_WINDOW)
+    for user_id, ts, score in labels:
+        while event is not None and (event[0], event[1]) <= (user_id, ts):
+            if event[0] != current:
+                current = event[0]
+                window.clear()
+            latest = event
+            window.append(event[2])
+            event = next(events, None)
+        while user is not None and user[0] < user_id:
+            user = next(users, None)
+
+        row = block[n]
+        row['label_time'], row['cognitive_score'] = ts, score
+        if current == user_id:
+            row['heart_rate'], row['steps'], row['calories'] = latest[2:]
+            row['hr_window'] = features.window_matrix([list(window)])[0]
+        else:
+            row['heart_rate'] = row['steps'] = row['calories'] = np.nan
+            row['hr_window'] = np.nan
+        row['date_of_birth'] = user[1] if user is not None and user[0] == user_id and user[1] else 'NaT'
+        n += 1
+        if n == block_rows:
+            flush(block)
+            n = 0
+    flush(block[:n])
+
+    for writer in writers.values():
+        writer.close()
+    return writers['label_time'].rows
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the offline training set from the raw archive and UserDB")
+    parser.add_argument('--raw-dir', type=str, default=None,
+                        help="Local copy of the raw archive (default: read s3://$BUCKET_NAME/raw/).")
+    parser.add_argument('--output', type=str, default="training_set",
+                        help="Output directory, one .npy file per column (default: %(default)s).")
+    parser.add_argument('--chunk-rows', type=int, default=1_000_000,
+                        help="Events sorted in memory at a time (default: %(default)s).")
+    parser.add_argument('--block-rows', type=int, default=10_000,
+                        help="Rows read or written per block while merging (default: %(default)s).")
+    parser.add_argument('--fan-in', type=int, default=256,
+                        help="Runs merged at once (default: %(default)s).")
+    parser.add_argument('--s3-threads', type=int, default=32)
+    parser.add_argument('--tmp-dir', type=str, default=None,
+                        help="Directory for the sorted runs and COPY files (default: system temp).")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.raw_dir is None and not BUCKET_NAME:
+        print("ERROR: set BUCKET_NAME or pass --raw-dir.")
+        sys.exit(1)
+    os.makedirs(args.output, exist_ok=True)
+
+    with tempfile.TemporaryDirectory(dir=args.tmp_dir) as tmp_dir:
+        labels_path, users_path = os.path.join(tmp_dir, "labels.csv"), os.path.join(tmp_dir, "users.csv")
+        conn = psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS, sslmode=SSL_MODE)
+        try:
+            with conn.cursor() as cursor:
+                copy_to_file(cursor, LABELS_QUERY, labels_path)
+                copy_to_file(cursor, USERS_QUERY, users_path)
+        finally:
+            conn.close()
+
+        events = local_events(args.raw_dir) if args.raw_dir else s3_events(BUCKET_NAME, RAW_PREFIX, args.s3_threads)
+        runs = write_sorted_runs(events, args.chunk_rows, tmp_dir)
+        merged = merged_events(runs, args.block_rows, args.fan_in, tmp_dir)
+        rows = join(read_labels(labels_path), merged, read_users(users_path), args.output, args.block_rows)
+
+    print(f"Wrote {rows} rows to {args.output}/ ({', '.join(ROW_DTYPE.names)})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import os
+import sys
+import time
+
+import pg8000.native
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "backend"))
+from db_pool import ConnectionPool, ReplicaRouter
+
+# Checks the backend's read-replica routing against two local Postgres instances,
+# e.g. a primary on 5432 and a streaming standby on 5433 (superuser needed to
+# pause replay). With an independent second instance only the routing is checked.
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Read-replica routing and lag fallback check")
+    parser.add_argument('--primary', type=str, default="localhost:5432")
+    parser.add_argument('--replica', type=str, default="localhost:5433")
+    parser.add_argument('--user', type=str, default="postgres")
+    parser.add_argument('--password', type=str, default=os.environ.get('PGPASSWORD', 'postgres'))
+    parser.add_argument('--database', type=str, default="postgres")
+    parser.add_argument('--max-lag', type=float, default=2.0,
+                        help="Replica lag bound in seconds (default: %(default)s).")
+    return parser.parse_args()
+
+def make_pool(args, address):
+    host, _, port = address.partition(':')
+    return ConnectionPool(lambda: pg8000.native.Connection(
+        user=args.user, password=args.password, host=host, port=int(port or 5432), database=args.database
+    ), max_size=2)
+
+def served_by(pool):
+    with pool.connection() as conn:
+        return conn.run("SELECT current_setting('port'), pg_is_in_recovery()")[0]
+
+def check(label, ok):
+    print(f"  [{'OK' if ok else 'FAIL'}] {label}")
+    return ok
+
+def main():
+    args = parse_args()
+    primary, replica = make_pool(args, args.primary), make_pool(args, args.replica)
+    router = ReplicaRouter(primary, [replica], max_lag=args.max_lag)
+    primary_port = served_by(primary)[0]
+    replica_port, standby = served_by(replica)
+    results = []
+
+    print("Routing")
+    results.append(check("reads go to the primary before the first lag check", router.reader() is primary))
+    print(f"  replica lag: {router.check_lag()[0]}")
+    results.append(check("reads go to the replica once it is known to be caught up",
+                         served_by(router.reader())[0] == replica_port))
+    results.append(check("writes use the primary", served_by(router.primary)[0] == primary_port))
+
+    if not standby:
+        print("Replica is not a standby, skipping the lag fallback check")
+    else:
+        print("Lag fallback")
+        with primary.connection() as conn:
+            conn.run("CREATE TABLE IF NOT EXISTS replica_check (ts TIMESTAMP)")
+        with replica.connection() as conn:
+            conn.run("SELECT pg_wal_replay_pause()")
+        try:
+            with primary.connection() as conn:
+                conn.run("INSERT INTO replica_check VALUES (now())")
+            time.sleep(args.max_lag + 1)
+            with primary.connection() as conn:
+                conn.run("INSERT INTO replica_check VALUES (now())")
+            time.sleep(0.5)
+            print(f"  replica lag with replay paused: {router.check_lag()[0]}")
+            results.append(check("reads fall back to the primary", router.reader() is primary))
+        finally:
+            with replica.connection() as conn:
+                conn.run("SELECT pg_wal_replay_resume()")
+        time.sleep(1)
+        print(f"  replica lag after resume: {router.check_lag()[0]}")
+        results.append(check("reads return to the replica", router.reader() is replica))
+        with primary.connection() as conn:
+            conn.run("DROP TABLE replica_check")
+
+    router.close()
+    print("All checks passed" if all(results) else "Some checks FAILED")
+    sys.exit(0 if all(results) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import argparse
+import os
+import sys
+import time
+
+import boto3
+from botocore.config import Config
+
+from bench_inference import model_input, run
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "backend"))
+from resilience import CircuitBreaker, CircuitOpenError, ResilientCaller
+
+# Exercises the backend's hedging and circuit breaker against scripts/fake_sagemaker.py.
+# Tail latency:  fake_sagemaker.py --slow-rate 0.05 --slow-ms 2000 --max-concurrency 8
+# Failures:      fake_sagemaker.py --error-rate 1.0
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Hedging / circuit breaker check against a fake endpoint")
+    parser.add_argument('--endpoint-url', type=str, default="http://localhost:8080")
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--timeout', type=float, default=10.0, help="Read timeout per attempt (seconds).")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+    client = boto3.client('sagemaker-runtime', region_name='us-east-1', endpoint_url=args.endpoint_url,
+                          config=Config(read_timeout=args.timeout, retries={'max_attempts': 1}))
+
+    def plain(body):
+        resp = client.invoke_endpoint(EndpointName='bench', ContentType='application/json', Body=body)
+        return resp['Body'].read()
+
+    run("plain", plain, args.requests, args.concurrency)
+
+    caller = ResilientCaller(plain, CircuitBreaker(open_seconds=5.0))
+    run("hedged + breaker", caller.call, args.requests, args.concurrency)
+    print(f"  hedges={caller.hedges} hedge_wins={caller.hedge_wins} "
+          f"breaker={caller.breaker.state} opened={caller.breaker.opened} "
+          f"p95_estimate={(caller.latency.value() or 0) * 1000:.1f}ms")
+
+    # With a failing endpoint the breaker should now reject calls without waiting
+    start = time.perf_counter()
+    try:
+        caller.call(model_input())
+        print("Endpoint healthy: call went through")
+    except CircuitOpenError:
+        print(f"Circuit open: failed fast in {(time.perf_counter() - start) * 1000:.2f}ms")
+    except Exception as e:
+        print(f"Call failed after {(time.perf_counter() - start) * 1000:.1f}ms: {e}")
+
+if __name__ == "__main__":
+    main()
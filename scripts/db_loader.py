@@ -2,7 +2,9 @@ import csv
 import ast
 import psycopg2
 import os
+import re
 import sys
+import argparse
 from dotenv import load_dotenv
 
 load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
@@ -38,6 +40,10 @@ def create_schema(cursor):
     
     # 1. Users Table
     cursor.execute("""
+        DROP TABLE IF EXISTS rollup_watermarks;
+        DROP TABLE IF EXISTS score_hourly_rollups;
+        DROP TABLE IF EXISTS user_hourly_rollups;
+        DROP TABLE IF EXISTS score_daily_stats;
         DROP TABLE IF EXISTS tracking_risks;
         DROP TABLE IF EXISTS cognitive_scores;
         DROP TABLE IF EXISTS users;
@@ -45,39 +51,221 @@ def create_schema(cursor):
         CREATE TABLE users (
             user_id VARCHAR(50) PRIMARY KEY,
             date_of_birth DATE,
-            diet_type VARCHAR(50)
+            diet_type VARCHAR(50),
+            site_id VARCHAR(50) NOT NULL DEFAULT 'default',
+            team_id VARCHAR(50) NOT NULL DEFAULT 'default'
         );
+
+        -- Site-wide status resolves the site's user list
+        CREATE INDEX users_site_idx ON users (site_id, user_id);
     """)
 
     # 2. Cognitive Scores Table (One-to-Many relationship)
+    # Partitioned by month on timestamp, so the key has to include it
     cursor.execute("""
         CREATE TABLE cognitive_scores (
-            cs_id VARCHAR(50) PRIMARY KEY,
+            cs_id VARCHAR(50) NOT NULL,
             user_id VARCHAR(50) REFERENCES users(user_id),
             event_id VARCHAR(50),
-            timestamp TIMESTAMP,
-            cognitive_score INT
-        );
+            timestamp TIMESTAMP NOT NULL,
+            cognitive_score INT,
+            -- When the row was written (UTC); the rollup watermark follows this,
+            -- so rows written late (replayed, delayed by an outage) are still rolled up
+            inserted_at TIMESTAMP NOT NULL DEFAULT (clock_timestamp() AT TIME ZONE 'UTC'),
+            PRIMARY KEY (cs_id, timestamp)
+        ) PARTITION BY RANGE (timestamp);
+
+        -- Dashboard 'ORDER BY timestamp DESC LIMIT 50' and keyset pagination
+        CREATE INDEX cognitive_scores_ts_idx ON cognitive_scores (timestamp DESC, cs_id DESC);
+        -- Per-worker history
+        CREATE INDEX cognitive_scores_user_ts_idx ON cognitive_scores (user_id, timestamp);
+        -- Rollup refreshes
+        CREATE INDEX cognitive_scores_inserted_idx ON cognitive_scores (inserted_at);
     """)
 
     # 3. Tracking Risks Table (One-to-Many relationship)
     # Note: Fixing typo 'hearth_rate' -> 'heart_rate' for clean DB schema
     cursor.execute("""
         CREATE TABLE tracking_risks (
-            tr_id VARCHAR(50) PRIMARY KEY,
+            tr_id VARCHAR(50) NOT NULL,
             user_id VARCHAR(50) REFERENCES users(user_id),
             event_id VARCHAR(50),
-            timestamp TIMESTAMP,
+            timestamp TIMESTAMP NOT NULL,
             steps INT,
             distance FLOAT,
             heart_rate INT,
             calories INT,
-            risk_metric VARCHAR(20)
+            risk_metric VARCHAR(20),
+            inserted_at TIMESTAMP NOT NULL DEFAULT (clock_timestamp() AT TIME ZONE 'UTC'),
+            PRIMARY KEY (tr_id, timestamp)
+        ) PARTITION BY RANGE (timestamp);
+
+        -- Dashboard join on (user_id, timestamp) answered from the index alone
+        CREATE INDEX tracking_risks_user_ts_idx ON tracking_risks (user_id, timestamp) INCLUDE (heart_rate);
+        CREATE INDEX tracking_risks_inserted_idx ON tracking_risks (inserted_at);
+    """)
+
+    # Creates the missing monthly partitions from 'from_month' up to 'months_ahead'
+    # months past the current one. The backend calls it on start and once a day.
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION ensure_monthly_partitions(parent TEXT, from_month DATE, months_ahead INT)
+        RETURNS VOID AS $$
+        DECLARE
+            m DATE := date_trunc('month', from_month);
+            stop DATE := date_trunc('month', CURRENT_DATE) + make_interval(months => months_ahead + 1);
+        BEGIN
+            WHILE m < stop LOOP
+                EXECUTE format(
+                    'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                    parent || '_' || to_char(m, 'YYYY_MM'), parent, m, (m + INTERVAL '1 month')::date
+                );
+                m := m + INTERVAL '1 month';
+            END LOOP;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+
+    # 4. Daily Score Summary (maintained by the backend with every inserted score)
+    # The dashboard reads O(days x sites) rows here instead of scanning cognitive_scores
+    cursor.execute("""
+        CREATE TABLE score_daily_stats (
+            day DATE NOT NULL,
+            site_id VARCHAR(50) NOT NULL,
+            score_count BIGINT NOT NULL DEFAULT 0,
+            score_sum BIGINT NOT NULL DEFAULT 0,
+            critical_count BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, site_id)
         );
     """)
 
+    # 5. Hourly Rollups for /api/analytics (per hour, site and team)
+    # Refreshed incrementally: only rows written (inserted_at) between the watermark
+    # and 'upto' are read and added to the hour of their event timestamp, so rows
+    # that arrive late still land in their (past) hour. A row is only missed if its
+    # transaction commits more than the backend's ROLLUP_LAG_SECONDS after it was written.
+    cursor.execute("""
+        CREATE TABLE score_hourly_rollups (
+            hour TIMESTAMP NOT NULL,
+            site_id VARCHAR(50) NOT NULL,
+            team_id VARCHAR(50) NOT NULL,
+            score_count BIGINT NOT NULL DEFAULT 0,
+            score_sum BIGINT NOT NULL DEFAULT 0,
+            critical_count BIGINT NOT NULL DEFAULT 0,
+            hr_count BIGINT NOT NULL DEFAULT 0,
+            hr_sum BIGINT NOT NULL DEFAULT 0,
+            hr_max INT,
+            PRIMARY KEY (hour, site_id, team_id)
+        );
+
+        -- Per-worker history charts over long ranges
+        CREATE TABLE user_hourly_rollups (
+            user_id VARCHAR(50) NOT NULL,
+            hour TIMESTAMP NOT NULL,
+            score_count BIGINT NOT NULL DEFAULT 0,
+            score_sum BIGINT NOT NULL DEFAULT 0,
+            hr_count BIGINT NOT NULL DEFAULT 0,
+            hr_sum BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, hour)
+        );
+
+        CREATE TABLE rollup_watermarks (
+            name VARCHAR(50) PRIMARY KEY,
+            last_ts TIMESTAMP NOT NULL
+        );
+        INSERT INTO rollup_watermarks (name, last_ts) VALUES ('hourly', '-infinity');
+
+        CREATE OR REPLACE FUNCTION refresh_hourly_rollups(upto TIMESTAMP)
+        RETURNS TIMESTAMP AS $$
+        DECLARE
+            lo TIMESTAMP;
+        BEGIN
+            -- Row lock: concurrent refreshes run one after the other
+            SELECT last_ts INTO lo FROM rollup_watermarks WHERE name = 'hourly' FOR UPDATE;
+            IF upto <= lo THEN
+                RETURN lo;
+            END IF;
+
+            INSERT INTO score_hourly_rollups AS r
+                (hour, site_id, team_id, score_count, score_sum, critical_count, hr_count, hr_sum, hr_max)
+            SELECT hour, site_id, team_id, SUM(score_count), SUM(score_sum), SUM(critical_count),
+                   SUM(hr_count), SUM(hr_sum), MAX(hr_max)
+            FROM (
+                SELECT date_trunc('hour', cs.timestamp) AS hour, u.site_id, u.team_id,
+                       COUNT(*) AS score_count, SUM(cs.cognitive_score) AS score_sum,
+                       COUNT(*) FILTER (WHERE cs.cognitive_score < 50) AS critical_count,
+                       0 AS hr_count, 0 AS hr_sum, NULL::INT AS hr_max
+                FROM cognitive_scores cs
+                JOIN users u ON u.user_id = cs.user_id
+                WHERE cs.inserted_at >= lo AND cs.inserted_at < upto
+                GROUP BY 1, 2, 3
+                UNION ALL
+                SELECT date_trunc('hour', tr.timestamp), u.site_id, u.team_id,
+                       0, 0, 0, COUNT(tr.heart_rate), SUM(tr.heart_rate), MAX(tr.heart_rate)
+                FROM tracking_risks tr
+                JOIN users u ON u.user_id = tr.user_id
+                WHERE tr.inserted_at >= lo AND tr.inserted_at < upto
+                GROUP BY 1, 2, 3
+            ) new_rows
+            GROUP BY 1, 2, 3
+            ON CONFLICT (hour, site_id, team_id) DO UPDATE SET
+                score_count = r.score_count + EXCLUDED.score_count,
+                score_sum = r.score_sum + EXCLUDED.score_sum,
+                critical_count = r.critical_count + EXCLUDED.critical_count,
+                hr_count = r.hr_count + EXCLUDED.hr_count,
+                hr_sum = r.hr_sum + EXCLUDED.hr_sum,
+                hr_max = GREATEST(r.hr_max, EXCLUDED.hr_max);
+
+            INSERT INTO user_hourly_rollups AS r
+                (user_id, hour, score_count, score_sum, hr_count, hr_sum)
+            SELECT user_id, hour, SUM(score_count), SUM(score_sum), SUM(hr_count), SUM(hr_sum)
+            FROM (
+                SELECT user_id, date_trunc('hour', timestamp) AS hour,
+                       COUNT(*) AS score_count, SUM(cognitive_score) AS score_sum, 0 AS hr_count, 0 AS hr_sum
+                FROM cognitive_scores
+                WHERE inserted_at >= lo AND inserted_at < upto
+                GROUP BY 1, 2
+                UNION ALL
+                SELECT user_id, date_trunc('hour', timestamp), 0, 0, COUNT(heart_rate), SUM(heart_rate)
+                FROM tracking_risks
+                WHERE inserted_at >= lo AND inserted_at < upto
+                GROUP BY 1, 2
+            ) new_rows
+            GROUP BY 1, 2
+            ON CONFLICT (user_id, hour) DO UPDATE SET
+                score_count = r.score_count + EXCLUDED.score_count,
+                score_sum = r.score_sum + EXCLUDED.score_sum,
+                hr_count = r.hr_count + EXCLUDED.hr_count,
+                hr_sum = r.hr_sum + EXCLUDED.hr_sum;
+
+            UPDATE rollup_watermarks SET last_ts = upto WHERE name = 'hourly';
+            RETURN upto;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+
+def earliest_month(*filenames):
+    """Returns the first day of the oldest month found in the CSV timestamps."""
+    months = []
+    for name in filenames:
+        with open(os.path.join(DATA_DIR, name), 'r') as f:
+            months.extend(row['timestamp'][:7] for row in csv.DictReader(f) if row['timestamp'])
+    return f"{min(months)}-01" if months else None
+
+def create_partitions(cursor, months_ahead=3):
+    """Creates monthly partitions covering the CSV data and the next few months."""
+    from_month = earliest_month('cognitive_scores.csv', 'tracking_risks.csv')
+    for table in ('cognitive_scores', 'tracking_risks'):
+        cursor.execute(
+            "SELECT ensure_monthly_partitions(%s, COALESCE(%s::date, CURRENT_DATE), %s)",
+            (table, from_month, months_ahead)
+        )
+
 def load_data(conn):
     cur = conn.cursor()
+
+    # --- STEP 0: PARTITIONS ---
+    print("Creating monthly partitions...")
+    create_partitions(cur)
     
     # --- STEP 1: LOAD USERS & BUILD MAPS ---
     print("Loading Users and mapping relationships...")
@@ -92,8 +280,9 @@ def load_data(conn):
         for row in reader:
             # Insert User
             cur.execute(
-                "INSERT INTO users (user_id, date_of_birth, diet_type) VALUES (%s, %s, %s)",
-                (row['userId'], row['date_of_birth'], row['diet_type'])
+                "INSERT INTO users (user_id, date_of_birth, diet_type, site_id, team_id) VALUES (%s, %s, %s, %s, %s)",
+                (row['userId'], row['date_of_birth'], row['diet_type'],
+                 row.get('site_id') or 'default', row.get('team_id') or 'default')
             )
 
             # Parse the array strings (e.g., "['id1', 'id2']") into actual lists
@@ -154,14 +343,149 @@ def load_data(conn):
                     row['risk_metric']
                 ))
 
+    # --- STEP 4: SEED DAILY SUMMARY ---
+    print("Building daily score summary...")
+    cur.execute("""
+        INSERT INTO score_daily_stats (day, site_id, score_count, score_sum, critical_count)
+        SELECT CAST(cs.timestamp AS DATE), u.site_id, COUNT(*), SUM(cs.cognitive_score),
+               COUNT(*) FILTER (WHERE cs.cognitive_score < 50)
+        FROM cognitive_scores cs
+        JOIN users u ON u.user_id = cs.user_id
+        GROUP BY 1, 2
+    """)
+
+    # --- STEP 5: HOURLY ROLLUPS ---
+    print("Building hourly rollups...")
+    cur.execute("SELECT refresh_hourly_rollups((clock_timestamp() AT TIME ZONE 'UTC')::timestamp)")
+
     conn.commit()
     print("Data load complete!")
 
+def detach_partitions_before(conn, cutoff):
+    """Detaches monthly partitions that end on or before 'cutoff' (YYYY-MM).
+
+    DETACH ... CONCURRENTLY only takes a brief lock, so the backend keeps
+    writing meanwhile. Detached tables stay in the database as plain tables
+    and can be archived or dropped on their own.
+    """
+    conn.autocommit = True  # CONCURRENTLY cannot run inside a transaction block
+    cur = conn.cursor()
+    cutoff_suffix = cutoff.replace('-', '_')
+    for parent in ('cognitive_scores', 'tracking_risks'):
+        cur.execute("""
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = %s ORDER BY c.relname
+        """, (parent,))
+        for (child,) in cur.fetchall():
+            if child[len(parent) + 1:] < cutoff_suffix:
+                print(f"Detaching {child}...")
+                cur.execute(f'ALTER TABLE {parent} DETACH PARTITION {child} CONCURRENTLY')
+
+# Hot queries of the backend; their plans should use the indexes above and
+# touch only the partitions they need
+HOT_QUERIES = {
+    "recent checks": """
+        SELECT u.user_id, cs.cognitive_score, cs.timestamp, tr.heart_rate
+        FROM cognitive_scores cs
+        JOIN users u ON u.user_id = cs.user_id
+        LEFT JOIN tracking_risks tr ON tr.user_id = cs.user_id AND tr.timestamp = cs.timestamp
+        ORDER BY cs.timestamp DESC LIMIT 50
+    """,
+    "dashboard stats": """
+        SELECT COALESCE(SUM(critical_count), 0), SUM(score_sum), SUM(score_count) FROM score_daily_stats
+    """,
+    "analytics year by day": """
+        SELECT date_trunc('day', hour), SUM(score_count), SUM(score_sum), SUM(critical_count)
+        FROM score_hourly_rollups WHERE hour >= NOW() - INTERVAL '365 days' GROUP BY 1
+    """,
+    "last month of scores": """
+        SELECT COUNT(*) FROM cognitive_scores WHERE timestamp >= date_trunc('month', NOW()) - INTERVAL '1 month'
+    """,
+}
+
+# Queries that must be pruned to a range of monthly partitions: (parent table,
+# SQL for the first month the query may touch, as 'YYYY_MM'). Later months
+# (incl. the ones created ahead) are expected, earlier ones must be pruned.
+PRUNED_QUERIES = {
+    "last month of scores": ("cognitive_scores", "to_char(date_trunc('month', NOW()) - INTERVAL '1 month', 'YYYY_MM')"),
+}
+
+def scanned_partitions(plan, parent):
+    """Partitions of 'parent' that appear as scan nodes in an EXPLAIN plan.
+
+    NOW() is only known at execution, so these queries are pruned when the
+    executor starts; plain EXPLAIN already shows that ('Subplans Removed').
+    """
+    found = re.findall(rf"\bon ({parent}_\d{{4}}_\d{{2}})\b", "\n".join(plan))
+    return set(found)
+
+def check_pruning(cursor, name, plan):
+    """True if the plan touches exactly the partitions PRUNED_QUERIES expects."""
+    parent, first_month_sql = PRUNED_QUERIES[name]
+    cursor.execute(f"SELECT {first_month_sql}")
+    first_month = cursor.fetchone()[0]
+    cursor.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = %s
+    """, (parent,))
+    expected = {child for (child,) in cursor.fetchall() if child[len(parent) + 1:] >= first_month}
+    scanned = scanned_partitions(plan, parent)
+    if scanned == expected:
+        print(f"Pruned to {len(scanned)} partition(s) from {first_month} on")
+        return True
+    print(f"WARNING: '{name}' should scan {sorted(expected)} but scans {sorted(scanned)}")
+    return False
+
+def explain_hot_queries(cursor):
+    """Prints the plan of each hot query and checks it.
+
+    Full scans of the fact tables are flagged, except for queries in
+    PRUNED_QUERIES, which must instead touch only their monthly partitions.
+    """
+    ok = True
+    for name, query in HOT_QUERIES.items():
+        cursor.execute("EXPLAIN " + query)
+        plan = [row[0] for row in cursor.fetchall()]
+        print(f"\n--- {name} ---")
+        print("\n".join(plan))
+        if name in PRUNED_QUERIES:
+            ok = check_pruning(cursor, name, plan) and ok
+            continue
+        seq_scans = [line for line in plan if 'Seq Scan on cognitive_scores' in line
+                     or 'Seq Scan on tracking_risks' in line]
+        if seq_scans:
+            ok = False
+            print(f"WARNING: '{name}' scans a fact table sequentially")
+    return ok
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="CPMS UserDB loader")
+    parser.add_argument('--explain', action='store_true',
+                        help="Only print the plans of the backend's hot queries.")
+    parser.add_argument('--detach-before', type=str, metavar='YYYY-MM',
+                        help="Only detach partitions older than this month.")
+    parser.add_argument('--ensure-partitions', action='store_true',
+                        help="Only create missing monthly partitions.")
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
     if "REPLACE" in DB_HOST:
         print("ERROR: Please update DB credentials in the script.")
     else:
         conn = get_db_connection()
-        create_schema(conn.cursor())
-        load_data(conn)
+        if args.explain:
+            sys.exit(0 if explain_hot_queries(conn.cursor()) else 1)
+        elif args.detach_before:
+            detach_partitions_before(conn, args.detach_before)
+        elif args.ensure_partitions:
+            create_partitions(conn.cursor())
+            conn.commit()
+        else:
+            create_schema(conn.cursor())
+            load_data(conn)
         conn.close()
\ No newline at end of file
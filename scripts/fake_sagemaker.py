@@ -0,0 +1,90 @@
+import argparse
+import importlib.util
+import json
+import os
+import random
+import re
+import tarfile
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the SageMaker runtime API (InvokeEndpoint only).
+# Point the backend (or boto3) at it with SAGEMAKER_ENDPOINT_URL=http://localhost:8080
+# It serves the same model.tar.gz as the real endpoint and can inject latency and errors.
+
+INVOCATIONS_PATH = re.compile(r"^/endpoints/[^/]+/invocations$")
+
+def load_handler(model_tar):
+    model_dir = tempfile.mkdtemp(prefix="fake_sagemaker_")
+    with tarfile.open(model_tar, "r:*") as tar:
+        tar.extractall(model_dir)
+    spec = importlib.util.spec_from_file_location("inference", os.path.join(model_dir, "inference.py"))
+    handler = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(handler)
+    return handler, handler.model_fn(model_dir)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fake SageMaker runtime endpoint for local benchmarks")
+    parser.add_argument('--model', type=str, default="model.tar.gz",
+                        help="Model artifact to serve (create one with setup_model.create_dummy_model()).")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency-ms', type=float, default=20.0,
+                        help="Added latency per invocation, simulates the network hop (default: %(default)s).")
+    parser.add_argument('--jitter-ms', type=float, default=5.0,
+                        help="Random extra latency in [0, jitter] (default: %(default)s).")
+    parser.add_argument('--slow-rate', type=float, default=0.0,
+                        help="Fraction of invocations that take --slow-ms instead, e.g. cold starts (default: %(default)s).")
+    parser.add_argument('--slow-ms', type=float, default=2000.0,
+                        help="Latency of the slow invocations (default: %(default)s).")
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help="Fraction of invocations answered with HTTP 500 (default: %(default)s).")
+    parser.add_argument('--max-concurrency', type=int, default=1,
+                        help="Invocations served at once, like serverless max_concurrency (default: %(default)s).")
+    return parser.parse_args()
+
+def make_handler(args, handler, model):
+    slots = threading.Semaphore(args.max_concurrency)
+
+    class InvocationHandler(BaseHTTPRequestHandler):
+        def log_message(self, *_):
+            pass
+
+        def reply(self, status, body):
+            data = body.encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            if not INVOCATIONS_PATH.match(self.path):
+                return self.reply(404, json.dumps({"message": "Unknown path"}))
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+            with slots:
+                if random.random() < args.slow_rate:
+                    time.sleep(args.slow_ms / 1000.0)
+                else:
+                    time.sleep((args.latency_ms + random.uniform(0, args.jitter_ms)) / 1000.0)
+                if random.random() < args.error_rate:
+                    return self.reply(500, json.dumps({"message": "Injected failure"}))
+                data = handler.input_fn(body, self.headers.get("Content-Type", "application/json"))
+                result = handler.output_fn(handler.predict_fn(data, model), "application/json")
+            self.reply(200, result)
+
+    return InvocationHandler
+
+def main():
+    args = parse_args()
+    handler, model = load_handler(args.model)
+    server = ThreadingHTTPServer(("0.0.0.0", args.port), make_handler(args, handler, model))
+    print(f"Fake SageMaker endpoint on http://localhost:{args.port} serving {args.model}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopped.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import argparse
+import ast
+import csv
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import features
+import setup_model
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+
+# Offline training of the linear readiness model on the on-launch data (/data).
+# Features come from features.build_matrix, the same code the model container
+# runs, so training and serving cannot drift apart. Every cognitive score is a
+# label; its wearable features are the user's readings at or before the score
+# (point in time), its age is taken at the score's timestamp.
+#
+# With '--training-set <dir>' (from scripts/build_training_set.py: archive +
+# UserDB) the columns are memory-mapped and the fit streams over them in
+# chunks, so the training set does not have to fit in memory.
+
+TRAINING_SET_COLUMNS = ('label_time', 'cognitive_score', 'heart_rate', 'steps', 'calories',
+                        'hr_window', 'date_of_birth')
+
+def read_csv(name):
+    with open(os.path.join(DATA_DIR, name), newline='') as f:
+        return list(csv.DictReader(f))
+
+def load_data():
+    """(users by id, labels, readings by user) from the CSVs."""
+    users, owner_of = {}, {}
+    for row in read_csv("users.csv"):
+        users[row['userId']] = row
+        for key in ('cognitive_scores', 'risk_trackings'):
+            for item_id in ast.literal_eval(row[key] or '[]'):
+                owner_of[item_id] = row['userId']
+
+    labels = [(owner_of[r['cs_id']], np.datetime64(r['timestamp'], 's'), float(r['cognitive_score']))
+              for r in read_csv("cognitive_scores.csv") if r['cs_id'] in owner_of]
+
+    readings = {}
+    for r in read_csv("tracking_risks.csv"):
+        uid = owner_of.get(r['tr_id'])
+        if uid:
+            readings.setdefault(uid, []).append(
+                (np.datetime64(r['timestamp'], 's'), float(r['hearth_rate']), float(r['steps']), float(r['calories'])))
+    return users, labels, readings
+
+def training_columns(users, labels, readings):
+    """Raw columns for build_matrix, the label times, the HR windows and the targets."""
+    labels = sorted(labels, key=lambda label: (label[0], label[1]))
+    n = len(labels)
+    columns = {name: np.full(n, np.nan) for name in ('heart_rate', 'steps', 'calories')}
+    columns['date_of_birth'] = [users[uid]['date_of_birth'] or None for uid, _, _ in labels]
+    at = np.array([ts for _, ts, _ in labels], dtype='datetime64[s]')
+    y = np.array([score for _, _, score in labels])
+    windows = np.full((n, features.HR_WINDOW), np.nan)
+
+    # Labels are grouped by user, so each user's readings are sorted once
+    start = 0
+    while start < n:
+        uid = labels[start][0]
+        stop = start
+        while stop < n and labels[stop][0] == uid:
+            stop += 1
+        series = sorted(readings.get(uid, []))
+        if series:
+            times = np.array([r[0] for r in series], dtype='datetime64[s]')
+            values = np.array([r[1:] for r in series])
+            latest = np.searchsorted(times, at[start:stop], side='right') - 1
+            seen = latest >= 0
+            for j, name in enumerate(('heart_rate', 'steps', 'calories')):
+                columns[name][start:stop][seen] = values[latest[seen], j]
+            windows[start:stop] = features.trailing_windows(times, values[:, 0], at[start:stop])
+        start = stop
+    return columns, at, windows, y
+
+def load_training_set(path, chunk_rows):
+    """(columns, label times, HR windows, targets) per chunk of a built training set."""
+    data = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r') for name in TRAINING_SET_COLUMNS}
+    for start in range(0, len(data['label_time']), chunk_rows):
+        chunk = {name: np.asarray(column[start:start + chunk_rows]) for name, column in data.items()}
+        columns = {name: chunk[name] for name in ('heart_rate', 'steps', 'calories', 'date_of_birth')}
+        yield columns, chunk['label_time'], chunk['hr_window'], chunk['cognitive_score']
+
+def matrices(chunks):
+    """(X, y) per chunk, built by the shared feature pipeline."""
+    for columns, at, windows, y in chunks:
+        yield features.build_matrix(columns, len(y), as_of=at, hr_windows=windows), y
+
+class Moments:
+    """Sums over (X, y) chunks; all the ridge fit needs from the data."""
+
+    def __init__(self, width):
+        self.n, self.sx, self.sy = 0, np.zeros(width), 0.0
+        self.sxx, self.sxy = np.zeros((width, width)), np.zeros(width)
+
+    def add(self, X, y):
+        self.n += len(y)
+        self.sx += X.sum(axis=0)
+        self.sy += y.sum()
+        self.sxx += X.T @ X
+        self.sxy += X.T @ y
+
+def fit(moments, prior, alpha):
+    """Ridge regression shrunk towards `prior` (not zero), in standardized space.
+
+    Columns without variance in the data (e.g. the form fields, which the
+    on-launch data does not have) keep their prior weight.
+    """
+    n = moments.n
+    mean, y_mean = moments.sx / n, moments.sy / n
+    cov = moments.sxx / n - np.outer(mean, mean)
+    std = np.sqrt(np.clip(np.diag(cov), 0, None))
+    varies = std > 1e-9
+    s = std[varies]
+    # Z'Z and Z'(y - mean y) of the standardized columns
+    ztz = n * cov[np.ix_(varies, varies)] / np.outer(s, s)
+    zty = (moments.sxy[varies] - n * mean[varies] * y_mean) / s
+    v = np.linalg.solve(ztz + alpha * np.eye(len(s)), zty + alpha * prior[varies] * s)
+    weights = prior.copy()
+    weights[varies] = v / s
+    return weights, float(y_mean - mean @ weights)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the readiness model and package model.tar.gz / model.tar")
+    parser.add_argument('--alpha', type=float, default=10.0,
+                        help="Strength of the pull towards the prior weights (default: %(default)s).")
+    parser.add_argument('--training-set', type=str, default=None,
+                        help="Directory from scripts/build_training_set.py (default: the CSVs in /data).")
+    parser.add_argument('--chunk-rows', type=int, default=1_000_000,
+                        help="Training set rows in memory at a time (default: %(default)s).")
+    parser.add_argument('--version', type=str, default="v3-linear-trained")
+    parser.add_argument('--output', type=str, default="model.tar.gz",
+                        help="Archive for the SageMaker endpoint (default: %(default)s).")
+    parser.add_argument('--local-output', type=str, default="model.tar",
+                        help="Uncompressed archive for INFERENCE_MODE=local (default: %(default)s).")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.training_set:
+        def chunks():
+            return matrices(load_training_set(args.training_set, args.chunk_rows))
+    else:
+        data = list(matrices([training_columns(*load_data())]))
+
+        def chunks():
+            return iter(data)
+
+    moments = Moments(len(features.FEATURE_COLUMNS))
+    for X, y in chunks():
+        moments.add(X, y)
+    print(f"Training on {moments.n} labels, {len(features.FEATURE_COLUMNS)} features")
+
+    prior = np.array([setup_model.DUMMY_WEIGHTS.get(name, 0.0) for name in features.FEATURE_COLUMNS])
+    weights, bias = fit(moments, prior, args.alpha)
+    # Second pass for the error, with the final weights
+    error = sum(np.abs(np.clip(X @ weights + bias, 0, 100) - y).sum() for X, y in chunks()) / moments.n
+    for name, w in zip(features.FEATURE_COLUMNS, weights):
+        print(f"  {name:<20} {w:+.4f}")
+    print(f"  {'bias':<20} {bias:+.4f}")
+    print(f"Mean absolute error on the training data: {error:.2f}")
+
+    setup_model.package_model(weights, bias, args.version, output=args.output, local_output=args.local_output)
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,162 @@
 import boto3
+import gzip
+import shutil
 import tarfile
 import os
 import io
+import json
+import numpy as np
 from dotenv import load_dotenv
 
+import features
+
 load_dotenv()
 
 # --- CONFIGURATION ---
 # REPLACE THIS with the bucket name from your 'terraform output s3_bucket'
 BUCKET_NAME = os.getenv("BUCKET_NAME") 
 
-def create_dummy_model():
-    """Creates a tar.gz file containing a mock inference script for SageMaker."""
-    
-    # This is the code that will run INSIDE SageMaker
-    inference_code = """
+# This is the code that will run INSIDE SageMaker (next to features.py, model.json and arrays/)
+INFERENCE_CODE = """
+import importlib.util
+import io
 import json
-import random
 import os
+import tarfile
+
+import numpy as np
+
+# The feature pipeline shared with the training job, loaded from this artifact
+# (not sys.path) so a hot-reloaded model never runs an older copy
+_spec = importlib.util.spec_from_file_location(
+    'cpms_features', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'features.py'))
+features = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(features)
+
+# NPY requests carry the finished matrix, columns in features.FEATURE_COLUMNS order
+NPY_CONTENT_TYPE = 'application/x-npy'
+
+def _map_npy(path, offset=0):
+    # Maps the .npy stored at `offset` of `path`; nothing is read until used
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        start = f.tell()
+    return np.asarray(np.memmap(path, dtype=dtype, mode='r', offset=start, shape=shape,
+                                order='F' if fortran_order else 'C'))
+
+def load_arrays(model_dir):
+    # Arrays (weights, tree tables, ...) are memory-mapped, not read into the
+    # heap: loading is instant and every process mapping the same file shares
+    # its pages. They are mapped straight out of the uncompressed archive when
+    # it sits in model_dir (local serving), else from the extracted files.
+    archive = os.path.join(model_dir, 'model.tar')
+    if os.path.exists(archive):
+        with tarfile.open(archive, 'r:') as tar:
+            members = [(m.name, m.offset_data) for m in tar if m.name.startswith('arrays/')]
+        return {os.path.basename(name)[:-4]: _map_npy(archive, offset) for name, offset in members}
+    folder = os.path.join(model_dir, 'arrays')
+    return {name[:-4]: np.load(os.path.join(folder, name), mmap_mode='r') for name in os.listdir(folder)}
 
 def model_fn(model_dir):
-    # Load model logic here (Mocking it for now)
-    return "DummyModel"
+    with open(os.path.join(model_dir, 'model.json')) as f:
+        meta = json.load(f)
+    if meta['columns'] != features.FEATURE_COLUMNS:
+        raise ValueError("The model was trained on a different feature layout")
+    return dict(load_arrays(model_dir), bias=meta['bias'], version=meta['version'])
 
 def input_fn(request_body, request_content_type):
-    if request_content_type == 'application/json':
-        return json.loads(request_body)
-    raise ValueError("Content type must be application/json")
+    # Accepts one feature object, a list of them (rows), an object of equally
+    # long lists (columns) or an NPY matrix
+    if request_content_type == NPY_CONTENT_TYPE:
+        X = np.load(io.BytesIO(request_body), allow_pickle=False).astype(np.float64, copy=False)
+        return {'X': np.atleast_2d(X), 'shape': 'npy'}
+    if request_content_type != 'application/json':
+        raise ValueError("Content type must be application/json or " + NPY_CONTENT_TYPE)
+    data = json.loads(request_body)
+    if isinstance(data, list):
+        names = set().union(*data) if data else ()
+        columns = {name: [row.get(name) for row in data] for name in names}
+        return {'X': features.build_matrix(columns, len(data)), 'shape': 'rows'}
+    lengths = {len(v) for k, v in data.items() if isinstance(v, list) and k != 'hr_recent'}
+    if lengths:
+        if len(lengths) > 1:
+            raise ValueError("Columns must have the same length")
+        return {'X': features.build_matrix(data, lengths.pop()), 'shape': 'columns'}
+    return {'X': features.build_matrix({k: [v] for k, v in data.items()}, 1), 'shape': 'object'}
 
 def predict_fn(input_data, model):
-    # SIMULATION: Return a random cognitive score
-    # In real life, this would use model.predict(input_data)
-    simulated_score = random.randint(40, 100)
-    return {'cognitive_score': simulated_score, 'model_version': 'v1-mock'}
+    # One matrix product for the whole batch
+    scores = np.clip(np.rint(input_data['X'] @ model['weights'] + model['bias']), 0, 100).astype(np.int64)
+    return dict(input_data, scores=scores, version=model['version'])
 
 def output_fn(prediction, response_content_type):
-    return json.dumps(prediction)
+    scores, version = prediction['scores'], prediction['version']
+    if response_content_type == NPY_CONTENT_TYPE:
+        buffer = io.BytesIO()
+        np.save(buffer, scores)
+        return buffer.getvalue()
+    if prediction['shape'] == 'object':
+        return json.dumps({'cognitive_score': int(scores[0]), 'model_version': version})
+    if prediction['shape'] == 'rows':
+        # Results in the same order as the input rows
+        return json.dumps([{'cognitive_score': s, 'model_version': version} for s in scores.tolist()])
+    return json.dumps({'cognitive_score': scores.tolist(), 'model_version': version})
 """
 
+FEATURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "features.py")
+
+# Mock linear model, one weight per column of features.FEATURE_COLUMNS
+DUMMY_WEIGHTS = {
+    'sleep_duration': 3.0, 'stress_level': -2.0, 'screen_time': -0.8, 'exercise_frequency': 2.0,
+    'caffeine_intake': 0.01, 'reaction_time': -0.04, 'memory_test_score': 0.25, 'heart_rate': -0.05,
+    'age': -0.1, 'hr_mean': -0.05, 'hr_std': -0.2,
+}
+
+def package_model(weights, bias, version, output="model.tar.gz", local_output="model.tar"):
+    """Packs inference.py, the shared features.py and the parameters twice.
+
+    `output` is the gzip archive SageMaker expects (model_data_url and
+    SAGEMAKER_SUBMIT_DIRECTORY). `local_output` holds the same members
+    uncompressed, for INFERENCE_MODE=local: its arrays are memory-mapped
+    right out of it, since each arrays/<name>.npy member starts on a
+    512-byte tar block and the .npy header pads its data to 64 bytes.
+    Returns both paths.
+    """
+    arrays = {'weights': np.asarray(weights, dtype=np.float64)}
+    meta = {'version': version, 'bias': float(bias), 'columns': features.FEATURE_COLUMNS}
+
     # Create directory structure
-    os.makedirs("model_code", exist_ok=True)
+    os.makedirs("model_code/arrays", exist_ok=True)
     with open("model_code/inference.py", "w") as f:
-        f.write(inference_code)
+        f.write(INFERENCE_CODE)
+    with open("model_code/model.json", "w") as f:
+        json.dump(meta, f)
+    for name, array in arrays.items():
+        np.save(f"model_code/arrays/{name}.npy", np.ascontiguousarray(array))
 
-    # Compress to model.tar.gz
-    with tarfile.open("model.tar.gz", "w:gz") as tar:
+    with tarfile.open(local_output, "w") as tar:
         tar.add("model_code/inference.py", arcname="inference.py")
-    
-    print("Created model.tar.gz")
-    return "model.tar.gz"
+        tar.add(FEATURES_PATH, arcname="features.py")
+        tar.add("model_code/model.json", arcname="model.json")
+        for name in arrays:
+            tar.add(f"model_code/arrays/{name}.npy", arcname=f"arrays/{name}.npy")
+
+    # Compress to model.tar.gz: the same tar, gzipped
+    with open(local_output, "rb") as src, gzip.open(output, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+
+    print(f"Created {output} and {local_output} (model {version})")
+    return [output, local_output]
+
+def create_dummy_model():
+    """Creates the model archives (tar.gz for SageMaker, tar for local inference) of a mock model."""
+    weights = [DUMMY_WEIGHTS.get(name, 0.0) for name in features.FEATURE_COLUMNS]
+    return package_model(weights, 70.0, "v2-linear-mock")
 
 def upload_to_s3(filename, bucket):
     s3 = boto3.client('s3')
@@ -61,9 +169,10 @@ if __name__ == "__main__":
     if "REPLACE" in BUCKET_NAME:
         print("ERROR: Please update BUCKET_NAME in the script with your Terraform output.")
     else:
-        file = create_dummy_model()
-        upload_to_s3(file, BUCKET_NAME)
+        files = create_dummy_model()
+        for file in files:
+            upload_to_s3(file, BUCKET_NAME)
         # Clean up local files
-        os.remove(file)
-        import shutil
+        for file in files:
+            os.remove(file)
         shutil.rmtree("model_code")
\ No newline at end of file
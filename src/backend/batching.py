@@ -0,0 +1,86 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """Coalesces concurrent single-item calls into batched calls.
+
+    submit() hands an item to a dispatcher thread and returns a Future. The
+    dispatcher waits at most `max_wait` seconds (or until `max_batch_size`
+    items are queued), calls `batch_fn` once with the list of items and
+    resolves every Future with the result at the same index. A result that
+    is an exception instance fails only that item's Future; an exception
+    raised by `batch_fn` fails the whole batch.
+
+    `concurrency` dispatchers run side by side; with 1, the next batch fills
+    up while the current one is in flight, which suits an endpoint that only
+    serves one request at a time.
+
+    Dispatchers start with the first submit() of each process, so a batcher
+    created before the server forks its workers works in every one of them.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=32, max_wait=0.003, concurrency=1):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.items = 0
+        self.concurrency = concurrency
+        self._queue = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            for i in range(self.concurrency):
+                threading.Thread(target=self._run, args=(self._queue,),
+                                 name=f'micro-batcher-{i}', daemon=True).start()
+            self._pid = os.getpid()
+
+    def submit(self, item):
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _collect(self, pending):
+        batch = [pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, pending):
+        while True:
+            batch = self._collect(pending)
+            items = [item for item, _ in batch]
+            self.batches += 1
+            self.items += len(items)
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise ValueError(f"Batch of {len(items)} returned {len(results)} results")
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
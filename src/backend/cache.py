@@ -0,0 +1,146 @@
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Flight:
+    """A load in progress that other callers of the same key wait on."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SharedGeneration:
+    """Invalidation counter in shared memory.
+
+    Created before the server forks its workers (the app is preloaded), so
+    every worker process sees the same counter: a bump in one worker clears
+    the caches attached to it in all of them.
+    """
+
+    def __init__(self):
+        self._value = multiprocessing.Value('Q', 0)
+
+    def bump(self):
+        with self._value.get_lock():
+            self._value.value += 1
+
+    @property
+    def value(self):
+        return self._value.value
+
+
+class TTLCache:
+    """Thread-safe LRU cache with per-entry TTL and single-flight loading.
+
+    get_or_load() runs the loader at most once per key at a time: concurrent
+    misses wait for the first caller and share its result. invalidate() drops
+    entries and also discards results of loads that started before it, so a
+    slow load can never put stale data back into the cache.
+
+    With a `shared_generation`, invalidate() of the whole cache also applies
+    to the caches of the other worker processes.
+    """
+
+    def __init__(self, max_size=1024, ttl=1.0, shared_generation=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}
+        self._generation = 0
+        self._shared = shared_generation
+        self._shared_seen = shared_generation.value if shared_generation else 0
+        self._lock = threading.Lock()
+
+    def _sync(self):
+        """Catches up with invalidations made by other processes."""
+        if self._shared is not None:
+            seen = self._shared.value
+            if seen != self._shared_seen:
+                self._shared_seen = seen
+                self._generation += 1
+                self._data.clear()
+
+    def _lookup(self, key, now):
+        self._sync()
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        if entry[0] <= now:
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, entry[1]
+
+    def _store(self, key, value, ttl):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def get(self, key, default=None):
+        with self._lock:
+            found, value = self._lookup(key, time.monotonic())
+            if found:
+                self.hits += 1
+                return value
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._sync()
+            self._store(key, value, ttl)
+
+    def get_or_load(self, key, loader, ttl=None):
+        with self._lock:
+            found, value = self._lookup(key, time.monotonic())
+            if found:
+                self.hits += 1
+                return value
+            self.misses += 1
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                generation = self._generation
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+                self._sync()
+                if flight.error is None and generation == self._generation:
+                    self._store(key, flight.value, ttl)
+            flight.event.set()
+        return flight.value
+
+    def invalidate(self, key=None):
+        """Drops one key (or everything) and fences off in-flight loads."""
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._data.clear()
+                if self._shared is not None:
+                    self._shared.bump()
+                    self._shared_seen = self._shared.value
+            else:
+                self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,160 @@
+import itertools
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+# Seconds a standby is behind its primary, 0 on a primary itself. Having
+# replayed everything received only means "caught up" while the WAL receiver
+# is streaming: the lag is then at least the time since the primary was last
+# heard from. Without a streaming receiver (disconnected, or the role lacks
+# pg_monitor to see it) the standby counts as infinitely behind. An idle
+# primary still sends keepalives every wal_sender_timeout / 2; keep that
+# below the routing bound (REPLICA_MAX_LAG_SECONDS).
+LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN r.last_msg_receipt_time IS NULL THEN 'Infinity'::FLOAT8
+        ELSE GREATEST(
+            EXTRACT(EPOCH FROM now() - r.last_msg_receipt_time)::FLOAT8,
+            CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                 ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::FLOAT8 END
+        )
+    END
+    FROM (SELECT 1) one
+    LEFT JOIN pg_stat_wal_receiver r ON r.status = 'streaming'
+"""
+
+
+class ConnectionPool:
+    """Small thread-safe pool of reusable database connections.
+
+    Connections are created on demand up to `max_size`; callers block for at
+    most `timeout` seconds when all of them are in use. A connection that
+    raised while borrowed is closed instead of being returned. The pool is
+    per process: after a fork the inherited connections are dropped (without
+    closing the parent's sockets) and new ones are opened.
+    """
+
+    def __init__(self, factory, max_size=10, timeout=10.0):
+        self.factory = factory
+        self.max_size = max_size
+        self.timeout = timeout
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _acquire(self):
+        self._check_pid()
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError("No database connection available")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            conn = self.factory()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._created += 1
+        return conn
+
+    def _release(self, conn, broken=False):
+        if os.getpid() != self._pid:
+            return
+        if broken:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        else:
+            self._idle.put(conn)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        except Exception:
+            self._release(conn, broken=True)
+            raise
+        self._release(conn)
+
+    def warm(self, count):
+        """Opens up to `count` connections ahead of the first requests."""
+        conns = []
+        try:
+            for _ in range(min(count, self.max_size)):
+                conns.append(self._acquire())
+        finally:
+            for conn in conns:
+                self._release(conn)
+        return len(conns)
+
+    def idle(self):
+        return self._idle.qsize()
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+class ReplicaRouter:
+    """Sends reads to replicas that are caught up, writes to the primary.
+
+    `replicas` are ConnectionPools of read-only standbys. check_lag(), run
+    every few seconds by a background thread, measures how far each one is
+    behind; a replica that lags more than `max_lag` seconds or cannot be
+    reached gets no reads until it has caught up. Without a usable replica
+    reads go to the primary.
+    """
+
+    def __init__(self, primary, replicas=(), max_lag=5.0):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.max_lag = max_lag
+        self.lag = [None] * len(self.replicas)  # seconds; None = unknown or unreachable
+        self._turn = itertools.count()
+
+    def check_lag(self):
+        for i, pool in enumerate(self.replicas):
+            try:
+                with pool.connection() as conn:
+                    lag = conn.run(LAG_QUERY)[0][0]
+                self.lag[i] = None if lag is None else float(lag)
+            except Exception as e:
+                if self.lag[i] is not None:
+                    print(f"Replica {i} unavailable: {e}")
+                self.lag[i] = None
+        return list(self.lag)
+
+    def reader(self):
+        """Pool for the next read: round-robin over the usable replicas."""
+        usable = [pool for pool, lag in zip(self.replicas, self.lag)
+                  if lag is not None and lag <= self.max_lag]
+        if not usable:
+            return self.primary
+        return usable[next(self._turn) % len(usable)]
+
+    def close(self):
+        for pool in [self.primary] + self.replicas:
+            pool.close()
@@ -0,0 +1,35 @@
+def lttb(points, threshold):
+    """Largest-Triangle-Three-Buckets downsampling.
+
+    `points` is a list of (x, y) sorted by x. Returns at most `threshold`
+    points that keep the visual shape (peaks and dips) of the series; the
+    first and last points are always kept.
+    """
+    n = len(points)
+    if threshold >= n:
+        return list(points)
+    if threshold < 3:
+        return [points[0], points[-1]][:max(threshold, 0)]
+
+    sampled = [points[0]]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle vertex
+        start = int((i + 1) * bucket_size) + 1
+        end = min(int((i + 2) * bucket_size) + 1, n)
+        next_bucket = points[start:end] or [points[-1]]
+        avg_x = sum(p[0] for p in next_bucket) / len(next_bucket)
+        avg_y = sum(p[1] for p in next_bucket) / len(next_bucket)
+
+        ax, ay = points[a]
+        best, best_area = None, -1.0
+        for j in range(int(i * bucket_size) + 1, int((i + 1) * bucket_size) + 1):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+    return sampled
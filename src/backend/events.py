@@ -0,0 +1,85 @@
+import asyncio
+import json
+import threading
+from collections import OrderedDict
+
+
+class Subscription:
+    """One connected dashboard.
+
+    Pending events are keyed (e.g. by event type and user), so a slow client
+    that has not drained its queue yet only ever sees the latest state of each
+    key instead of an ever-growing backlog.
+    """
+
+    def __init__(self, loop, site_id=None, max_pending=1000):
+        self.loop = loop
+        self.site_id = site_id
+        self.max_pending = max_pending
+        self.wake = asyncio.Event()
+        self.coalesced = 0
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+
+    def offer(self, key, event):
+        with self._lock:
+            if key in self._pending:
+                self.coalesced += 1
+                del self._pending[key]
+            self._pending[key] = event
+            while len(self._pending) > self.max_pending:
+                self._pending.popitem(last=False)
+                self.coalesced += 1
+        self.loop.call_soon_threadsafe(self.wake.set)
+
+    def drain(self):
+        with self._lock:
+            events = list(self._pending.values())
+            self._pending.clear()
+        self.wake.clear()
+        return events
+
+
+class EventBroadcaster:
+    """Fans out events from request threads to server-sent-event streams."""
+
+    def __init__(self, max_pending=1000):
+        self.max_pending = max_pending
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, site_id=None):
+        sub = Subscription(asyncio.get_running_loop(), site_id, self.max_pending)
+        with self._lock:
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def publish(self, key, event, site_id=None):
+        """Delivers `event` to all subscribers of `site_id` (and of all sites)."""
+        with self._lock:
+            targets = [s for s in self._subscribers if s.site_id is None or s.site_id == site_id]
+        for sub in targets:
+            sub.offer(key, event)
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    async def stream(self, sub, is_disconnected, heartbeat=15.0):
+        """Yields SSE frames for `sub` until the client goes away."""
+        try:
+            yield "retry: 3000\n\n"
+            while not await is_disconnected():
+                try:
+                    await asyncio.wait_for(sub.wake.wait(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies/ALB from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                for event in sub.drain():
+                    yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            self.unsubscribe(sub)
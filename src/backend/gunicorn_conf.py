@@ -0,0 +1,38 @@
+import multiprocessing
+import os
+
+# Production server: gunicorn manages SERVER_WORKERS uvicorn worker processes
+# (default: one per core). The app, and a local model if INFERENCE_MODE=local,
+# are loaded once before forking so the workers share their memory pages; each
+# worker then opens its own database connections and background threads.
+#   gunicorn -c gunicorn_conf.py main:app
+
+workers = int(os.environ.get('SERVER_WORKERS', '0')) or multiprocessing.cpu_count()
+worker_class = 'uvicorn.workers.UvicornWorker'
+bind = os.environ.get('SERVER_BIND', '0.0.0.0:80')
+preload_app = True
+# A worker that does not check in for this long is restarted
+timeout = int(os.environ.get('SERVER_TIMEOUT', '60'))
+graceful_timeout = 30
+keepalive = 75
+
+# Read by main.py when it is imported below (preload_app)
+os.environ.setdefault('MULTI_WORKER', 'true' if workers > 1 else 'false')
+os.environ['SERVER_WORKERS'] = str(workers)
+
+
+def when_ready(server):
+    # Still the single master process: workers are forked after this
+    import main
+    main.preload()
+
+
+def post_fork(server, worker):
+    import main
+    main.after_fork()
+
+
+def child_exit(server, worker):
+    # Runs in the master, however the worker ended (also when it was killed)
+    import main
+    main.clear_ready(worker.pid)
@@ -0,0 +1,201 @@
+import importlib.util
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import boto3
+
+# Set in each pool process by _init_worker
+_handler = None
+_model = None
+
+
+def _load(model_dir):
+    """Loads inference.py from the extracted artifact, like the SageMaker container."""
+    spec = importlib.util.spec_from_file_location('inference', os.path.join(model_dir, 'inference.py'))
+    handler = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(handler)
+    return handler, handler.model_fn(model_dir)
+
+
+def _init_worker(model_dir):
+    global _handler, _model
+    _handler, _model = _load(model_dir)
+
+
+def _is_gzip(path):
+    with open(path, 'rb') as f:
+        return f.read(2) == b'\x1f\x8b'
+
+
+def _ready(_):
+    return os.getpid()
+
+
+def _run(handler, model, body, content_type):
+    data = handler.input_fn(body, content_type)
+    prediction = handler.predict_fn(data, model)
+    return handler.output_fn(prediction, 'application/json')
+
+
+def _predict(body, content_type):
+    return _run(_handler, _model, body, content_type)
+
+
+class LocalModel:
+    """Runs the packaged model (model.tar, or a model.tar.gz) in a local process pool.
+
+    `model_uri` is an s3://bucket/key URI or a local path. A background
+    thread checks it every `poll_interval` seconds; when the version (S3 ETag
+    or file mtime/size) changes, the new artifact is loaded into a fresh pool
+    which then replaces the old one. Requests already running on the old pool
+    finish there. `on_reload(version)` is called after every swap.
+
+    With `in_process=True` the model runs in the calling process instead, for
+    servers that already have one worker process per core. Loading it before
+    the server forks (preload()) lets all workers share its memory pages.
+
+    Each version is published once under `work_dir` (atomic rename) and kept
+    as the uncompressed archive plus its code: the model maps its arrays
+    straight out of the archive, so every process serving that version
+    shares one copy in the page cache and a swap costs no deserialization.
+    A swap only replaces a reference; requests that picked up the previous
+    model finish on it, its mappings outlive the removal of its files.
+    """
+
+    def __init__(self, model_uri, workers=None, poll_interval=60.0, work_dir='/tmp/cpms_model', on_reload=None,
+                 in_process=False):
+        self.model_uri = model_uri
+        self.on_reload = on_reload
+        self.workers = workers or os.cpu_count()
+        self.poll_interval = poll_interval
+        self.work_dir = work_dir
+        self.in_process = in_process
+        self.version = None
+        self._pool = None
+        self._loaded = None  # (handler, model) in in-process mode
+        self._model_dir = None
+        self._lock = threading.Lock()
+        self._s3 = boto3.client('s3') if model_uri.startswith('s3://') else None
+
+    def preload(self):
+        """Loads the current version now, e.g. in the server before it forks."""
+        self.reload_if_changed()
+
+    def after_fork(self):
+        """Forked workers must not share the parent's S3 connections."""
+        if self._s3:
+            self._s3 = boto3.client('s3')
+
+    def start(self):
+        self.reload_if_changed()
+        threading.Thread(target=self._poll, name='model-reload', daemon=True).start()
+
+    def _s3_location(self):
+        bucket, _, key = self.model_uri[len('s3://'):].partition('/')
+        return bucket, key
+
+    def current_version(self):
+        if self._s3:
+            bucket, key = self._s3_location()
+            return self._s3.head_object(Bucket=bucket, Key=key)['ETag'].strip('"')
+        st = os.stat(self.model_uri)
+        return f"{int(st.st_mtime)}-{st.st_size}"
+
+    def _fetch(self, version):
+        """Downloads one artifact version into its own directory, shared by all processes."""
+        model_dir = os.path.join(self.work_dir, version)
+        if os.path.isdir(model_dir):
+            # Already published by another worker process
+            return model_dir
+        os.makedirs(self.work_dir, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=f'.{version}-', dir=self.work_dir)
+        archive = os.path.join(staging, 'model.tar')
+        if self._s3:
+            bucket, key = self._s3_location()
+            self._s3.download_file(bucket, key, archive)
+        else:
+            shutil.copyfile(self.model_uri, archive)
+        if _is_gzip(archive):
+            # Compressed artifacts (the SageMaker model.tar.gz) have to be
+            # extracted in full; their arrays are then mapped from the files
+            with tarfile.open(archive, 'r:gz') as tar:
+                tar.extractall(staging)
+            os.remove(archive)
+        else:
+            # Only the code and metadata; the arrays are mapped from the archive
+            with tarfile.open(archive, 'r:') as tar:
+                tar.extractall(staging, members=[m for m in tar if not m.name.startswith('arrays/')])
+        try:
+            os.rename(staging, model_dir)
+        except OSError:
+            # Another process published the same version first
+            shutil.rmtree(staging, ignore_errors=True)
+        return model_dir
+
+    def reload_if_changed(self):
+        version = self.current_version()
+        if version == self.version:
+            return False
+        model_dir = self._fetch(version)
+        if self.in_process:
+            loaded = _load(model_dir)
+            with self._lock:
+                self._loaded = loaded
+                self.version = version
+                old_dir, self._model_dir = self._model_dir, model_dir
+        else:
+            pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(model_dir,))
+            # Make sure every worker has loaded the model before it takes traffic
+            list(pool.map(_ready, range(self.workers)))
+            with self._lock:
+                old, self._pool = self._pool, pool
+                self.version = version
+                old_dir, self._model_dir = self._model_dir, model_dir
+            if old:
+                old.shutdown(wait=False)
+        if old_dir:
+            shutil.rmtree(old_dir, ignore_errors=True)
+        print(f"Local model loaded: version {version}")
+        if self.on_reload:
+            self.on_reload(version)
+        return True
+
+    def _poll(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.reload_if_changed()
+            except Exception as e:
+                print(f"Model reload failed: {e}")
+
+    def invoke(self, body, content_type='application/json'):
+        """Same contract as invoke_endpoint: request body in, response body out."""
+        if self.in_process:
+            loaded = self._loaded
+            if loaded is None:
+                raise RuntimeError("Local model is not available")
+            return _run(*loaded, body, content_type)
+        for _ in range(2):
+            with self._lock:
+                pool = self._pool
+            if pool is None:
+                break
+            try:
+                future = pool.submit(_predict, body, content_type)
+            except RuntimeError:
+                # Pool was swapped and shut down between lookup and submit
+                continue
+            return future.result()
+        raise RuntimeError("Local model is not available")
+
+    def stop(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+            self._loaded = None
+        if pool:
+            pool.shutdown(wait=True)
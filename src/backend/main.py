@@ -1,14 +1,35 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Header
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
 import boto3
+from botocore.config import Config
 import pg8000.native
 import os
 import json
+import base64
+import hashlib
 import ssl
 import uuid
-from datetime import datetime
-from typing import Optional
+import fcntl
+import multiprocessing
+import select
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Optional, List
+from write_behind import WriteBehindQueue
+from cache import TTLCache, SharedGeneration
+from db_pool import ConnectionPool, ReplicaRouter
+from events import EventBroadcaster
+from batching import MicroBatcher
+from local_model import LocalModel
+from metrics import registry, span, SharedMetrics, TimingMiddleware
+from resilience import CircuitBreaker, ResilientCaller
+from downsample import lttb
+from serialization import FastJSONResponse, FeatureBuilder, dumps, loads
 
 app = FastAPI()
 
@@ -18,7 +39,10 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+# Per-stage timings: /metrics (Prometheus) and the Server-Timing header
+app.add_middleware(TimingMiddleware)
 
 # Config
 ENDPOINT_NAME = os.environ.get('SAGEMAKER_ENDPOINT', 'cpms-demo-endpoint')
@@ -27,11 +51,155 @@ DB_HOST = os.environ.get('DB_HOST')
 DB_PASS = os.environ.get('DB_PASS')
 DB_USER = "dbadmin"
 DB_NAME = "cpms_user_db"
+DB_PORT = int(os.environ.get('DB_PORT', '5432'))
+# 'false' for local Postgres instances without TLS
+DB_SSL = os.environ.get('DB_SSL', 'true').lower() == 'true'
+# Read replicas ("host[:port],..."): dashboard, history and analytics reads go to
+# a replica that is at most REPLICA_MAX_LAG_SECONDS behind, otherwise to the primary
+DB_REPLICA_HOSTS = [h.strip() for h in os.environ.get('DB_REPLICA_HOSTS', '').split(',') if h.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', '5'))
+REPLICA_LAG_CHECK_SECONDS = float(os.environ.get('REPLICA_LAG_CHECK_SECONDS', '2'))
+# Connections kept open per server process, and how long a request waits for one
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '10'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+# Set by gunicorn_conf.py when several server processes share the app preloaded
+# before fork: live events are relayed between them through Postgres NOTIFY and
+# the local model runs inside each process instead of in its own pool
+MULTI_WORKER = os.environ.get('MULTI_WORKER', 'false').lower() == 'true'
+EVENT_CHANNEL = 'cpms_events'
+# The relay wakes up as soon as a notification arrives; this only bounds the wait
+EVENT_RELAY_POLL_MS = float(os.environ.get('EVENT_RELAY_POLL_MS', '100'))
+# With several workers each one writes its metrics here every METRICS_WRITE_SECONDS
+# and /metrics merges them, so a scrape sees the whole server whichever worker answers
+METRICS_DIR = os.environ.get('METRICS_DIR', '/tmp/cpms_metrics')
+METRICS_WRITE_SECONDS = float(os.environ.get('METRICS_WRITE_SECONDS', '5'))
+# Worker processes of this server (set by gunicorn_conf.py); /ready waits for all of them
+SERVER_WORKERS = max(1, int(os.environ.get('SERVER_WORKERS', '1')))
+# Startup warm-up before /ready reports the task ready: pool connections opened
+# per worker, and how long the optional steps (DynamoDB, model, caches) are retried
+WARMUP_DB_CONNECTIONS = int(os.environ.get('WARMUP_DB_CONNECTIONS', '2'))
+WARMUP_TIMEOUT = float(os.environ.get('WARMUP_TIMEOUT', '120'))
+# Only the process holding this lock runs partition maintenance and rollup refreshes
+MAINTENANCE_LOCK_PATH = os.environ.get('MAINTENANCE_LOCK_PATH', '/tmp/cpms_maintenance.lock')
+# Write-behind: return the score right away and persist it in the background
+WRITE_BEHIND = os.environ.get('WRITE_BEHIND', 'true').lower() == 'true'
+WRITE_BEHIND_MAX_SIZE = int(os.environ.get('WRITE_BEHIND_MAX_SIZE', '10000'))
+WRITE_BEHIND_BATCH_SIZE = int(os.environ.get('WRITE_BEHIND_BATCH_SIZE', '500'))
+WRITE_BEHIND_INTERVAL_MS = float(os.environ.get('WRITE_BEHIND_INTERVAL_MS', '5'))
+WRITE_BEHIND_SPILL_PATH = os.environ.get('WRITE_BEHIND_SPILL_PATH', '/tmp/cpms_score_spill.jsonl')
+# Spilled rows are retried this often while writes succeed (and on start)
+WRITE_BEHIND_REPLAY_SECONDS = float(os.environ.get('WRITE_BEHIND_REPLAY_SECONDS', '5'))
+# Rows Postgres rejects (constraint or data errors) are set aside here, not retried
+WRITE_BEHIND_DEAD_LETTER_PATH = os.environ.get('WRITE_BEHIND_DEAD_LETTER_PATH', '/tmp/cpms_score_dead_letter.jsonl')
+# Monthly partitions of cognitive_scores/tracking_risks are created this far ahead
+PARTITION_MONTHS_AHEAD = int(os.environ.get('PARTITION_MONTHS_AHEAD', '3'))
+# Hourly analytics rollups are brought up to (now - lag) every interval; the lag
+# leaves room for rows that commit slightly after their timestamp (write-behind)
+ROLLUP_REFRESH_SECONDS = float(os.environ.get('ROLLUP_REFRESH_SECONDS', '60'))
+ROLLUP_LAG_SECONDS = float(os.environ.get('ROLLUP_LAG_SECONDS', '60'))
+# Worker history: ranges up to this many days are read from raw rows, longer
+# ones from the per-user hourly rollups
+HISTORY_RAW_MAX_DAYS = float(os.environ.get('HISTORY_RAW_MAX_DAYS', '7'))
+HISTORY_MAX_POINTS = 2000
+# Dashboard stats are shared by all viewers for this long (new scores invalidate it earlier)
+DASHBOARD_CACHE_TTL = float(os.environ.get('DASHBOARD_CACHE_TTL', '5'))
+# Shared secret the stream processor sends with live pulses (push disabled if unset)
+STREAM_PUSH_TOKEN = os.environ.get('STREAM_PUSH_TOKEN')
+# Also used for the user list of each site
+USER_SITE_CACHE_TTL = float(os.environ.get('USER_SITE_CACHE_TTL', '600'))
+# Latest wearable aggregates are served from memory for this long; the
+# simulated devices report every ~2s and pushed pulses refresh entries early
+FEATURE_CACHE_TTL = float(os.environ.get('FEATURE_CACHE_TTL', '2'))
+FEATURE_CACHE_SIZE = int(os.environ.get('FEATURE_CACHE_SIZE', '50000'))
+# 'remote' = SageMaker endpoint, 'local' = run model.tar from MODEL_URI in-process
+INFERENCE_MODE = os.environ.get('INFERENCE_MODE', 'remote')
+MODEL_URI = os.environ.get('MODEL_URI')  # s3://<bucket>/models/model.tar or a local path
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', '0')) or None  # default: one per core
+MODEL_POLL_INTERVAL = float(os.environ.get('MODEL_POLL_INTERVAL', '60'))
+# Lets the remote path point at a local stand-in endpoint (scripts/fake_sagemaker.py)
+SAGEMAKER_ENDPOINT_URL = os.environ.get('SAGEMAKER_ENDPOINT_URL')
+# Model endpoint protection: one attempt per call with a bounded timeout, a hedged
+# duplicate after the recent p95 latency, and a circuit breaker on the error rate
+MODEL_TIMEOUT = float(os.environ.get('MODEL_TIMEOUT', '10'))
+HEDGE_REQUESTS = os.environ.get('HEDGE_REQUESTS', 'true').lower() == 'true'
+HEDGE_MIN_DELAY_MS = float(os.environ.get('HEDGE_MIN_DELAY_MS', '50'))
+HEDGE_MAX_DELAY_MS = float(os.environ.get('HEDGE_MAX_DELAY_MS', '2000'))
+HEDGE_BUDGET = float(os.environ.get('HEDGE_BUDGET', '0.1'))
+BREAKER_ERROR_RATE = float(os.environ.get('BREAKER_ERROR_RATE', '0.5'))
+BREAKER_OPEN_SECONDS = float(os.environ.get('BREAKER_OPEN_SECONDS', '10'))
+# While the endpoint is failing: answer from this local model artifact if set,
+# otherwise with the worker's last known score (if not older than LAST_SCORE_TTL)
+FALLBACK_MODEL_URI = os.environ.get('FALLBACK_MODEL_URI')
+LAST_SCORE_TTL = float(os.environ.get('LAST_SCORE_TTL', '3600'))
+# Identical model inputs within this window are answered from memory
+PREDICTION_CACHE = os.environ.get('PREDICTION_CACHE', 'true').lower() == 'true'
+PREDICTION_CACHE_TTL = float(os.environ.get('PREDICTION_CACHE_TTL', '60'))
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', '10000'))
+# Concurrent /api/predict calls are sent to the model as one batched invocation.
+# Dispatchers by default (0): one for the serverless endpoint (max_concurrency = 1),
+# one per pool process for a local model in a process pool.
+INFERENCE_BATCHING = os.environ.get('INFERENCE_BATCHING', 'true').lower() == 'true'
+INFERENCE_MAX_BATCH = int(os.environ.get('INFERENCE_MAX_BATCH', '64'))
+INFERENCE_MAX_WAIT_MS = float(os.environ.get('INFERENCE_MAX_WAIT_MS', '3'))
+INFERENCE_CONCURRENCY = int(os.environ.get('INFERENCE_CONCURRENCY', '0'))
+INFERENCE_TIMEOUT = float(os.environ.get('INFERENCE_TIMEOUT', '30'))
+# Largest crew accepted by /api/predict/batch
+MAX_BATCH_PREDICT = int(os.environ.get('MAX_BATCH_PREDICT', '500'))
+# Sort key of the per-user 'latest state' item written by the stream processor
+LATEST_SORT_KEY = 'LATEST'
+# BatchGetItem accepts at most 100 keys per call
+DYNAMO_BATCH_SIZE = 100
 
 # Clients
-sagemaker_runtime = boto3.client('sagemaker-runtime', region_name='us-east-1')
+sagemaker_runtime = boto3.client(
+    'sagemaker-runtime', region_name='us-east-1', endpoint_url=SAGEMAKER_ENDPOINT_URL,
+    # Retries are handled by hedging; a stuck call must not hold a request for minutes
+    config=Config(connect_timeout=2, read_timeout=MODEL_TIMEOUT, retries={'max_attempts': 1})
+)
+local_model = LocalModel(
+    MODEL_URI, INFERENCE_WORKERS, MODEL_POLL_INTERVAL, on_reload=lambda version: set_model_version(version),
+    in_process=MULTI_WORKER
+) if INFERENCE_MODE == 'local' else None
+fallback_model = LocalModel(FALLBACK_MODEL_URI, 1, MODEL_POLL_INTERVAL, '/tmp/cpms_fallback_model',
+                            in_process=MULTI_WORKER) if FALLBACK_MODEL_URI else None
 dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
 
+# Single statement = single round-trip and a single implicit transaction.
+# Rows are passed as parallel arrays so one call writes a whole batch.
+# We also save the 'snapshot' of heart rate at this moment into tracking_risks
+# (This logic mimics the 'TrackingRisk' table population in your report)
+# The dashboard counters in score_daily_stats are updated in the same transaction;
+# only rows actually inserted are counted, so replaying a spill file cannot double count.
+SAVE_SCORES_SQL = """
+    WITH rows AS (
+        SELECT * FROM unnest(
+            CAST(:tr_ids AS VARCHAR[]), CAST(:cs_ids AS VARCHAR[]), CAST(:uids AS VARCHAR[]),
+            CAST(:ts AS TIMESTAMP[]), CAST(:hrs AS INT[]), CAST(:risks AS VARCHAR[]),
+            CAST(:steps AS INT[]), CAST(:scores AS INT[])
+        ) AS r(tr_id, cs_id, user_id, ts, heart_rate, risk_metric, steps, score)
+    ), tr AS (
+        INSERT INTO tracking_risks
+            (tr_id, user_id, timestamp, heart_rate, risk_metric, steps, distance, calories)
+        SELECT tr_id, user_id, ts, heart_rate, risk_metric, steps, 0, 0 FROM rows
+        ON CONFLICT DO NOTHING
+    ), cs AS (
+        INSERT INTO cognitive_scores (cs_id, user_id, timestamp, cognitive_score)
+        SELECT cs_id, user_id, ts, score FROM rows
+        ON CONFLICT DO NOTHING
+        RETURNING user_id, timestamp, cognitive_score
+    )
+    INSERT INTO score_daily_stats (day, site_id, score_count, score_sum, critical_count)
+    SELECT CAST(cs.timestamp AS DATE), u.site_id, COUNT(*), SUM(cs.cognitive_score),
+           COUNT(*) FILTER (WHERE cs.cognitive_score < 50)
+    FROM cs
+    JOIN users u ON u.user_id = cs.user_id
+    GROUP BY 1, 2
+    ON CONFLICT (day, site_id) DO UPDATE SET
+        score_count = score_daily_stats.score_count + EXCLUDED.score_count,
+        score_sum = score_daily_stats.score_sum + EXCLUDED.score_sum,
+        critical_count = score_daily_stats.critical_count + EXCLUDED.critical_count
+"""
+
 # --- DATA MODELS ---
 class PredictRequest(BaseModel):
     user_id: str
@@ -43,98 +211,1017 @@ class PredictRequest(BaseModel):
     reaction_time: float     # ms
     memory_test_score: int   # 0-100
 
+class BatchPredictRequest(BaseModel):
+    requests: List[PredictRequest]
+
+class PredictResponse(BaseModel):
+    user_id: str
+    score: int
+    status: str
+    fallback: Optional[str] = None  # 'model' or 'last-known' when the endpoint did not answer
+    score_age_seconds: Optional[float] = None  # age of a 'last-known' score
+
+class BatchPredictResult(BaseModel):
+    user_id: str
+    score: Optional[int] = None  # None when the user could not be scored
+    status: str
+    error: Optional[str] = None
+    fallback: Optional[str] = None
+    score_age_seconds: Optional[float] = None
+
+class BatchPredictResponse(BaseModel):
+    results: List[BatchPredictResult]
+
+class PulseUpdate(BaseModel):
+    user_id: str
+    timestamp: Optional[str] = None
+    heart_rate: float = 0
+    steps: float = 0
+    calories: float = 0
+    hr_recent: List[float] = []
+
+class PulseBatch(BaseModel):
+    updates: List[PulseUpdate]
+
 # --- HELPERS ---
-def get_db_conn():
-    ssl_context = ssl.create_default_context()
-    ssl_context.check_hostname = False
-    ssl_context.verify_mode = ssl.CERT_NONE
-    return pg8000.native.Connection(
-        user=DB_USER, password=DB_PASS, host=DB_HOST, database=DB_NAME, ssl_context=ssl_context
-    )
+def get_db_conn(host=None):
+    """Connects to the primary, or to `host` ("host[:port]", e.g. a replica)."""
+    host, _, port = (host or DB_HOST).partition(':')
+    with span('db_connect'):
+        ssl_context = None
+        if DB_SSL:
+            ssl_context = ssl.create_default_context()
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE
+        return pg8000.native.Connection(
+            user=DB_USER, password=DB_PASS, host=host, port=int(port or DB_PORT), database=DB_NAME,
+            ssl_context=ssl_context
+        )
+
+# Per process: a forked worker opens its own connections
+db_pool = ConnectionPool(get_db_conn, max_size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT)
+db_router = ReplicaRouter(
+    db_pool,
+    [ConnectionPool(lambda h=h: get_db_conn(h), max_size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT)
+     for h in DB_REPLICA_HOSTS],
+    max_lag=REPLICA_MAX_LAG_SECONDS,
+)
+
+def db_read_connection():
+    """Connection for read-only queries that tolerate REPLICA_MAX_LAG_SECONDS of staleness."""
+    pool = db_router.reader()
+    registry.inc('cpms_db_reads_total', help_text='Read-only queries per target',
+                 target='primary' if pool is db_pool else 'replica')
+    return pool.connection()
+
+def replica_lag_loop():
+    while True:
+        db_router.check_lag()
+        time.sleep(REPLICA_LAG_CHECK_SECONDS)
+
+registry.gauge('cpms_replica_lag_seconds', lambda: {
+    (('replica', host),): -1 if lag is None else lag for host, lag in zip(DB_REPLICA_HOSTS, db_router.lag)
+}, 'Replay lag of each read replica (-1 = unreachable)')
+
+def build_score_row(user_id, features, score, status):
+    """Snapshot of one prediction, JSON-safe so it can be queued or spilled."""
+    return {
+        'tr_id': str(uuid.uuid4()),
+        'cs_id': str(uuid.uuid4()),
+        'user_id': user_id,
+        'timestamp': datetime.utcnow().isoformat(),
+        'heart_rate': int(features.get('heart_rate', 0)),
+        'risk_metric': status,
+        'steps': int(features.get('steps', 0)),
+        'score': int(score),
+    }
+
+def save_scores(conn, rows):
+    """Persists predictions and their heart-rate snapshots in one round-trip.
+
+    Both rows of a prediction get the same timestamp so the dashboard join on
+    (user_id, timestamp) always matches.
+    """
+    with span('db_write'):
+        conn.run(
+            SAVE_SCORES_SQL,
+            tr_ids=[r['tr_id'] for r in rows], cs_ids=[r['cs_id'] for r in rows],
+            uids=[r['user_id'] for r in rows], ts=[r['timestamp'] for r in rows],
+            hrs=[r['heart_rate'] for r in rows], risks=[r['risk_metric'] for r in rows],
+            steps=[r['steps'] for r in rows], scores=[r['score'] for r in rows]
+        )
+
+# One payload shared by every dashboard viewer; concurrent misses run one query.
+# New scores saved by any worker process invalidate it in all of them.
+dashboard_cache = TTLCache(max_size=1, ttl=DASHBOARD_CACHE_TTL, shared_generation=SharedGeneration())
+
+# Live dashboards (server-sent events)
+broadcaster = EventBroadcaster()
+
+# Site of each user, for per-site subscriptions
+user_site_cache = TTLCache(max_size=100000, ttl=USER_SITE_CACHE_TTL)
+
+def get_user_sites(user_ids):
+    """Maps user ids to site ids, one query for all the ones not cached yet."""
+    sites, missing = {}, []
+    for uid in set(user_ids):
+        site = user_site_cache.get(uid)
+        if site is None:
+            missing.append(uid)
+        else:
+            sites[uid] = site
+    if missing:
+        with db_read_connection() as conn:
+            rows = conn.run("SELECT user_id, site_id FROM users WHERE user_id = ANY(:uids)", uids=missing)
+        for uid, site in rows:
+            user_site_cache.set(uid, site)
+            sites[uid] = site
+    return sites
+
+# Date of birth of each user (model feature 'age'); None when unknown
+user_birth_date_cache = TTLCache(max_size=100000, ttl=USER_SITE_CACHE_TTL)
+_NOT_CACHED = object()
+
+def get_user_birth_dates(user_ids):
+    """Maps user ids to users.date_of_birth; users not found are left out.
+
+    Returns None when the lookup itself failed: without the database the
+    model gets no age rather than the prediction failing.
+    """
+    dates, missing = {}, []
+    for uid in set(user_ids):
+        dob = user_birth_date_cache.get(uid, _NOT_CACHED)
+        if dob is _NOT_CACHED:
+            missing.append(uid)
+        else:
+            dates[uid] = dob
+    if missing:
+        try:
+            with db_read_connection() as conn:
+                rows = conn.run("SELECT user_id, date_of_birth FROM users WHERE user_id = ANY(:uids)",
+                                uids=missing)
+        except Exception as e:
+            print(f"Birth date lookup failed: {e}")
+            return None
+        for uid, dob in rows:
+            user_birth_date_cache.set(uid, dob)
+            dates[uid] = dob
+    return dates
+
+def get_known_birth_dates(user_ids):
+    """get_user_birth_dates, with a 404 for user ids missing from users.
+
+    Their scores would only be rejected by the users foreign key once the
+    response is gone.
+    """
+    dates = get_user_birth_dates(user_ids)
+    if dates is None:
+        return {}
+    unknown = sorted(set(user_ids) - dates.keys())
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown user: {', '.join(unknown)}")
+    return dates
+
+# user ids of each site, for the site-wide status view
+site_users_cache = TTLCache(max_size=1000, ttl=USER_SITE_CACHE_TTL)
+
+def get_site_user_ids(site_id):
+    def load():
+        with db_read_connection() as conn:
+            rows = conn.run("SELECT user_id FROM users WHERE site_id = :site ORDER BY user_id", site=site_id)
+        return [r[0] for r in rows]
+    return site_users_cache.get_or_load(site_id, load)
+
+def publish_events(events):
+    """Delivers (key, event, site_id) tuples to the dashboards of every process.
+
+    With several worker processes the events go through Postgres NOTIFY (one
+    round-trip per batch) and each process's listener publishes them locally.
+    """
+    if not MULTI_WORKER:
+        for key, event, site_id in events:
+            broadcaster.publish(key, event, site_id)
+        return
+    payloads, chunk, size = [], [], 0
+    for key, event, site_id in events:
+        item = json.dumps([key, event, site_id], default=str)
+        # NOTIFY payloads are limited to 8000 bytes
+        if chunk and size + len(item) > 7000:
+            payloads.append('[' + ','.join(chunk) + ']')
+            chunk, size = [], 0
+        chunk.append(item)
+        size += len(item) + 1
+    if chunk:
+        payloads.append('[' + ','.join(chunk) + ']')
+    with db_pool.connection() as conn:
+        conn.run("SELECT pg_notify(:channel, p) FROM unnest(CAST(:payloads AS TEXT[])) AS p",
+                 channel=EVENT_CHANNEL, payloads=payloads)
+
+def event_relay_loop():
+    """Publishes events NOTIFYed by any worker process to this process's subscribers."""
+    while True:
+        conn = None
+        try:
+            conn = get_db_conn()
+            # pg8000 keeps only the last 100 notifications and silently drops
+            # older ones; a burst must not lose events
+            conn.notifications = deque()
+            conn.run(f"LISTEN {EVENT_CHANNEL}")
+            sock = getattr(conn, '_usock', None)
+            while True:
+                # Block until the server sends something instead of polling;
+                # the timeout covers bytes already buffered by the TLS layer
+                if sock is not None:
+                    select.select([sock], [], [], EVENT_RELAY_POLL_MS / 1000.0)
+                else:
+                    time.sleep(EVENT_RELAY_POLL_MS / 1000.0)
+                # Notifications are read along with the response of any statement
+                conn.run("SELECT 1")
+                while conn.notifications:
+                    _, _, payload = conn.notifications.popleft()
+                    for key, event, site_id in json.loads(payload):
+                        broadcaster.publish(tuple(key), event, site_id)
+        except Exception as e:
+            print(f"Event relay failed, reconnecting: {e}")
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            time.sleep(1)
+
+def publish_scores(rows):
+    """Pushes new scores (and critical alerts) to subscribed dashboards."""
+    if not MULTI_WORKER and not len(broadcaster):
+        return
+    sites = get_user_sites([r['user_id'] for r in rows])
+    events = []
+    for r in rows:
+        site_id = sites.get(r['user_id'])
+        event = {
+            "type": "score",
+            "user_id": r['user_id'],
+            "site_id": site_id,
+            "score": r['score'],
+            "status": r['risk_metric'],
+            "heart_rate": r['heart_rate'],
+            "timestamp": r['timestamp'],
+        }
+        events.append((("score", r['user_id']), event, site_id))
+        if r['risk_metric'] == 'Critical':
+            events.append((("alert", r['user_id']), dict(event, type="alert"), site_id))
+    publish_events(events)
+
+def on_scores_saved(rows):
+    """Called once new scores are committed to Postgres."""
+    dashboard_cache.invalidate()
+    try:
+        publish_scores(rows)
+    except Exception as e:
+        print(f"Publishing scores failed: {e}")
+
+_writer_conn = None
+
+def is_rejected_row_error(e):
+    """Postgres refused the rows themselves (data exception or integrity
+    constraint violation): retrying the same rows cannot succeed."""
+    if not isinstance(e, pg8000.native.DatabaseError) or not e.args or not isinstance(e.args[0], dict):
+        return False
+    return e.args[0].get('C', '')[:2] in ('22', '23')
+
+def flush_scores(rows):
+    """Write-behind flush: reuses one connection, reconnects after a failure."""
+    global _writer_conn
+    if _writer_conn is None:
+        _writer_conn = get_db_conn()
+    try:
+        save_scores(_writer_conn, rows)
+    except Exception:
+        try:
+            _writer_conn.close()
+        except Exception:
+            pass
+        _writer_conn = None
+        raise
+    on_scores_saved(rows)
+
+score_writer = WriteBehindQueue(
+    flush_scores,
+    max_size=WRITE_BEHIND_MAX_SIZE,
+    batch_size=WRITE_BEHIND_BATCH_SIZE,
+    flush_interval=WRITE_BEHIND_INTERVAL_MS / 1000.0,
+    spill_path=WRITE_BEHIND_SPILL_PATH,
+    replay_interval=WRITE_BEHIND_REPLAY_SECONDS,
+    is_permanent_error=is_rejected_row_error,
+    dead_letter_path=WRITE_BEHIND_DEAD_LETTER_PATH,
+)
+
+def normalize_dynamo_item(item):
+    """The 'latest state' item keeps the real event time in last_timestamp."""
+    if item.get('timestamp') == LATEST_SORT_KEY:
+        item = dict(item, timestamp=item.get('last_timestamp'))
+        item.pop('last_timestamp', None)
+    return item
+
+# Read-through cache in front of DynamoDB (status + predict for the same user
+# usually come seconds apart); concurrent misses for one user share one query
+feature_cache = TTLCache(max_size=FEATURE_CACHE_SIZE, ttl=FEATURE_CACHE_TTL)
+
+registry.gauge('cpms_write_behind_queue_depth', lambda: {(): score_writer.qsize()},
+               'Prediction results waiting to be written')
+registry.gauge('cpms_sse_subscribers', lambda: {(): len(broadcaster)}, 'Connected live dashboards')
 
 def get_latest_dynamo_features(user_id):
+    """Fetches the latest hot-path data (wearables) for a user, cached."""
+    with span('features'):
+        return feature_cache.get_or_load(user_id, lambda: query_latest_dynamo_features(user_id))
+
+def query_latest_dynamo_features(user_id):
     """Fetches the latest hot-path data (wearables) for a user."""
     table = dynamodb.Table(TABLE_NAME)
-    resp = table.query(
-        KeyConditionExpression=boto3.dynamodb.conditions.Key('user_id').eq(user_id),
-        Limit=1, ScanIndexForward=False
-    )
+    with span('dynamo_query'):
+        resp = table.query(
+            KeyConditionExpression=boto3.dynamodb.conditions.Key('user_id').eq(user_id),
+            Limit=1, ScanIndexForward=False
+        )
     # Return features or defaults if no data exists yet
     if resp['Items']:
-        return resp['Items'][0]
+        return normalize_dynamo_item(resp['Items'][0])
     return {'heart_rate': 0, 'steps': 0, 'calories': 0}
 
+# Shared by the parallel BatchGetItem calls and per-user fallbacks
+dynamo_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix='dynamo')
+
+def batch_get_latest_items(user_ids):
+    """One BatchGetItem call (<= 100 keys) for the 'latest state' items."""
+    found = {}
+    request = {TABLE_NAME: {'Keys': [{'user_id': uid, 'timestamp': LATEST_SORT_KEY} for uid in user_ids]}}
+    attempt = 0
+    while request:
+        with span('dynamo_batch_get'):
+            resp = dynamodb.batch_get_item(RequestItems=request)
+        for item in resp['Responses'].get(TABLE_NAME, []):
+            found[item['user_id']] = normalize_dynamo_item(item)
+        # Throttled keys come back unprocessed; retry them with backoff
+        request = resp.get('UnprocessedKeys') or None
+        if request:
+            attempt += 1
+            time.sleep(min(0.05 * 2 ** attempt, 1.0))
+    return found
+
+def get_latest_dynamo_features_batch(user_ids, fallback=True):
+    """Fetches the latest hot-path data for many users with BatchGetItem.
+
+    Chunks of 100 keys are requested in parallel. Returns {user_id: features}.
+    Users without a 'latest state' item (e.g. written before it existed) fall
+    back to the per-user query, or are left out when fallback is False.
+    """
+    found = {}
+    unique_ids = []
+    for uid in dict.fromkeys(user_ids):
+        cached = feature_cache.get(uid)
+        if cached is None:
+            unique_ids.append(uid)
+        else:
+            found[uid] = cached
+    chunks = [unique_ids[i:i + DYNAMO_BATCH_SIZE] for i in range(0, len(unique_ids), DYNAMO_BATCH_SIZE)]
+    for items in dynamo_pool.map(batch_get_latest_items, chunks):
+        for uid, item in items.items():
+            feature_cache.set(uid, item)
+        found.update(items)
+    if fallback:
+        missing = [uid for uid in unique_ids if uid not in found]
+        found.update(zip(missing, dynamo_pool.map(get_latest_dynamo_features, missing)))
+    return found
+
+# Model input: live wearable data (DynamoDB item, Decimals as numbers) merged
+# with the manual form data and the user's profile, in a fixed layout built
+# without intermediate dicts. The model container derives its features from
+# these raw fields (features.py).
+MODEL_AGGREGATE_FIELDS = {'timestamp': None, 'heart_rate': 0, 'steps': 0, 'calories': 0, 'hr_recent': None}
+MODEL_PROFILE_FIELDS = {'date_of_birth': None}
+build_model_input = FeatureBuilder(PredictRequest.__fields__, MODEL_AGGREGATE_FIELDS, MODEL_PROFILE_FIELDS)
+
+def call_model_endpoint(payload):
+    if local_model:
+        return local_model.invoke(payload)
+    sm_resp = sagemaker_runtime.invoke_endpoint(
+        EndpointName=ENDPOINT_NAME,
+        ContentType='application/json',
+        Body=payload
+    )
+    return sm_resp['Body'].read()
+
+model_caller = ResilientCaller(
+    call_model_endpoint,
+    CircuitBreaker(error_threshold=BREAKER_ERROR_RATE, open_seconds=BREAKER_OPEN_SECONDS),
+    hedge=HEDGE_REQUESTS and local_model is None,
+    min_hedge_delay=HEDGE_MIN_DELAY_MS / 1000.0,
+    max_hedge_delay=HEDGE_MAX_DELAY_MS / 1000.0,
+    hedge_budget=HEDGE_BUDGET,
+)
+
+# Last successful score per user, served while the model endpoint is down;
+# entries are (time scored, prediction)
+last_score_cache = TTLCache(max_size=100000, ttl=LAST_SCORE_TTL)
+
+def fallback_predictions(model_input, error):
+    """Answers without the model endpoint.
+
+    A single input re-raises `error` if it has no fallback. In a list every
+    item is resolved on its own: items without one get `error` in place of
+    their result, so the rest of the batch is still answered.
+    """
+    if fallback_model:
+        # Tagged like last-known scores: never memoized, never taken as the model version
+        result = loads(fallback_model.invoke(dumps(model_input)))
+        if isinstance(result, list):
+            return [dict(r, fallback='model') for r in result]
+        return dict(result, fallback='model')
+    inputs = model_input if isinstance(model_input, list) else [model_input]
+    results = []
+    for item in inputs:
+        last = last_score_cache.get(item.get('user_id'))
+        if last is None:
+            results.append(error)
+            continue
+        scored_at, prediction = last
+        results.append(dict(prediction, fallback='last-known',
+                            score_age_seconds=round(time.time() - scored_at, 1)))
+    if isinstance(model_input, list):
+        return results
+    if results[0] is error:
+        raise error
+    return results[0]
+
+# --- PREDICTION CACHE ---
+# Keyed by a fingerprint of the normalized model input and the model version
+prediction_cache = TTLCache(max_size=PREDICTION_CACHE_SIZE, ttl=PREDICTION_CACHE_TTL)
+model_version = None
+
+# Bookkeeping fields that do not change the prediction
+NON_FEATURE_KEYS = ('timestamp', 'last_timestamp')
+
+def set_model_version(version):
+    """A new model makes every memoized prediction stale."""
+    global model_version
+    if version != model_version:
+        model_version = version
+        prediction_cache.invalidate()
+
+def feature_fingerprint(model_input):
+    features = {k: v for k, v in model_input.items() if k not in NON_FEATURE_KEYS}
+    raw = dumps([model_version, features], sort_keys=True)
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+def fallback_fields(result):
+    """Response fields marking an answer that is not the model's for these inputs."""
+    if 'fallback' not in result:
+        return {}
+    return {"fallback": result['fallback'], "score_age_seconds": result.get('score_age_seconds')}
+
+def remember_prediction(key, result):
+    if PREDICTION_CACHE and 'fallback' not in result:
+        prediction_cache.set(key, result)
+
+def invoke_model(model_input):
+    """Calls the model with one feature object (or a list of them for a batch)."""
+    payload = dumps(model_input)
+    with span('model_invoke'):
+        try:
+            result = loads(model_caller.call(payload))
+        except Exception as e:
+            print(f"Model call failed, trying fallback: {e}")
+            registry.inc('cpms_model_fallbacks_total', help_text='Predictions answered without the model endpoint')
+            return fallback_predictions(model_input, e)
+    now = time.time()
+    if isinstance(model_input, list) and isinstance(result, list):
+        for item, prediction in zip(model_input, result):
+            last_score_cache.set(item.get('user_id'), (now, prediction))
+    elif isinstance(result, dict):
+        last_score_cache.set(model_input.get('user_id'), (now, result))
+    # Remote endpoints report their version with every answer; only the
+    # primary endpoint's answers count, fallbacks returned above
+    first = result[0] if isinstance(result, list) and result else result
+    if local_model is None and isinstance(first, dict) and first.get('model_version'):
+        set_model_version(first['model_version'])
+    return result
+
+registry.gauge('cpms_model_circuit_open', lambda: {(): int(model_caller.breaker.state != 'closed')},
+               'Whether the model endpoint circuit breaker is open')
+registry.gauge('cpms_model_calls', lambda: {
+    (('kind', 'calls'),): model_caller.calls,
+    (('kind', 'hedges'),): model_caller.hedges,
+    (('kind', 'hedge_wins'),): model_caller.hedge_wins,
+    (('kind', 'circuit_opened'),): model_caller.breaker.opened,
+}, 'Model endpoint calls, hedged duplicates and breaker trips since start')
+
+def invoke_model_batch(model_inputs):
+    """One model call for many feature objects; results keep the input order.
+
+    Items that could not be scored hold an exception instead of a result.
+    """
+    predictions = invoke_model(model_inputs)
+    if not isinstance(predictions, list) or len(predictions) != len(model_inputs):
+        raise ValueError("Model returned a result that does not match the batch")
+    return predictions
+
+model_batcher = MicroBatcher(
+    invoke_model_batch,
+    max_batch_size=INFERENCE_MAX_BATCH,
+    max_wait=INFERENCE_MAX_WAIT_MS / 1000.0,
+    concurrency=INFERENCE_CONCURRENCY or (
+        local_model.workers if local_model and not local_model.in_process else 1),
+) if INFERENCE_BATCHING else None
+
+def predict_one(model_input):
+    key = feature_fingerprint(model_input)
+    if PREDICTION_CACHE:
+        cached = prediction_cache.get(key)
+        if cached is not None:
+            return cached
+    # 'model' includes the time spent waiting for a batch to fill
+    with span('model'):
+        if model_batcher is None:
+            result = invoke_model(model_input)
+        else:
+            result = model_batcher.submit(model_input).result(timeout=INFERENCE_TIMEOUT)
+    remember_prediction(key, result)
+    return result
+
+def predict_many(model_inputs):
+    """Batch version of predict_one: only cache misses go to the model."""
+    keys = [feature_fingerprint(m) for m in model_inputs]
+    results = [prediction_cache.get(k) if PREDICTION_CACHE else None for k in keys]
+    misses = [i for i, r in enumerate(results) if r is None]
+    if misses:
+        with span('model'):
+            predictions = invoke_model_batch([model_inputs[i] for i in misses])
+        for i, prediction in zip(misses, predictions):
+            results[i] = prediction
+            if not isinstance(prediction, Exception):
+                remember_prediction(keys[i], prediction)
+    return results
+
+def _cache_stats():
+    caches = {'dashboard': dashboard_cache, 'features': feature_cache, 'predictions': prediction_cache,
+              'user_sites': user_site_cache, 'birth_dates': user_birth_date_cache}
+    stats = {}
+    for name, cache in caches.items():
+        stats[(('cache', name), ('result', 'hit'))] = cache.hits
+        stats[(('cache', name), ('result', 'miss'))] = cache.misses
+    return stats
+
+registry.gauge('cpms_cache_lookups', _cache_stats, 'Cache hits and misses since start')
+
+def persist_scores(rows):
+    if WRITE_BEHIND:
+        for row in rows:
+            score_writer.put(row)
+    else:
+        with db_pool.connection() as conn:
+            save_scores(conn, rows)
+        on_scores_saved(rows)
+
+def ensure_partitions():
+    """Makes sure next months' partitions of the fact tables exist."""
+    with db_pool.connection() as conn:
+        for table in ('cognitive_scores', 'tracking_risks'):
+            conn.run(
+                "SELECT ensure_monthly_partitions(:t, CURRENT_DATE, :n)",
+                t=table, n=PARTITION_MONTHS_AHEAD
+            )
+
+_maintenance_lock = None
+
+def is_maintenance_leader():
+    """True in the one server process that runs the periodic maintenance jobs.
+
+    The lock is released when its process exits, so a replacement worker
+    takes over.
+    """
+    global _maintenance_lock
+    if _maintenance_lock is None:
+        f = open(MAINTENANCE_LOCK_PATH, 'a')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        _maintenance_lock = f
+    return True
+
+def partition_maintenance_loop():
+    while True:
+        try:
+            if is_maintenance_leader():
+                ensure_partitions()
+        except Exception as e:
+            print(f"Partition maintenance failed: {e}")
+        time.sleep(24 * 3600)
+
+def refresh_rollups():
+    """Folds rows newer than the rollup watermark into score_hourly_rollups."""
+    with db_pool.connection() as conn:
+        with span('rollup_refresh'):
+            upto = datetime.utcnow() - timedelta(seconds=ROLLUP_LAG_SECONDS)
+            return conn.run("SELECT refresh_hourly_rollups(:upto)", upto=upto)[0][0]
+
+def rollup_refresh_loop():
+    while True:
+        try:
+            if is_maintenance_leader():
+                refresh_rollups()
+        except Exception as e:
+            print(f"Rollup refresh failed: {e}")
+        time.sleep(ROLLUP_REFRESH_SECONDS)
+
+shared_metrics = SharedMetrics(registry, METRICS_DIR, METRICS_WRITE_SECONDS) if MULTI_WORKER else None
+
+# --- LIFECYCLE ---
+
+def preload():
+    """Runs in the server process before it forks the workers (gunicorn_conf.py).
+
+    The local models are loaded once here and their memory pages are shared
+    copy-on-write by every worker.
+    """
+    for model in (local_model, fallback_model):
+        if model and model.in_process:
+            model.preload()
+    if shared_metrics:
+        shared_metrics.reset()
+
+def after_fork():
+    """Runs first thing in every forked worker process."""
+    for model in (local_model, fallback_model):
+        if model:
+            model.after_fork()
+
+@app.on_event("startup")
+def start_event_relay():
+    if MULTI_WORKER:
+        threading.Thread(target=event_relay_loop, name='event-relay', daemon=True).start()
+
+@app.on_event("startup")
+def start_metrics_writer():
+    if shared_metrics:
+        shared_metrics.start()
+
+@app.on_event("startup")
+def start_rollup_refresh():
+    threading.Thread(target=rollup_refresh_loop, name='rollups', daemon=True).start()
+
+@app.on_event("startup")
+def start_partition_maintenance():
+    threading.Thread(target=partition_maintenance_loop, name='partitions', daemon=True).start()
+
+@app.on_event("startup")
+def start_local_model():
+    if local_model:
+        local_model.start()
+    if fallback_model:
+        fallback_model.start()
+
+@app.on_event("shutdown")
+def stop_local_model():
+    if local_model:
+        local_model.stop()
+    if fallback_model:
+        fallback_model.stop()
+
+@app.on_event("startup")
+def start_score_writer():
+    if WRITE_BEHIND:
+        score_writer.start()
+
+@app.on_event("shutdown")
+def stop_score_writer():
+    if WRITE_BEHIND:
+        score_writer.stop()
+
+@app.on_event("startup")
+def start_replica_lag_checks():
+    if db_router.replicas:
+        threading.Thread(target=replica_lag_loop, name='replica-lag', daemon=True).start()
+
+@app.on_event("shutdown")
+def close_db_pool():
+    db_router.close()
+
+# --- WARM-UP / READINESS ---
+
+WARMUP_USER_ID = '__warmup__'
+
+def warm_up_model():
+    """One real inference, so the first request does not hit a cold endpoint."""
+    sample = {
+        'user_id': WARMUP_USER_ID, 'heart_rate': 70, 'steps': 0, 'calories': 0,
+        'sleep_duration': 7.0, 'stress_level': 5, 'screen_time': 4.0, 'exercise_frequency': 'Moderate',
+        'caffeine_intake': 100, 'reaction_time': 250.0, 'memory_test_score': 80,
+    }
+    loads(call_model_endpoint(dumps(sample)))
+
+def warm_up_replicas():
+    for pool in db_router.replicas:
+        pool.warm(WARMUP_DB_CONNECTIONS)
+    db_router.check_lag()
+
+def prime_caches():
+    dashboard_cache.get_or_load('stats', encoded_dashboard_stats)
+    with db_read_connection() as conn:
+        rows = conn.run("SELECT user_id, site_id, date_of_birth FROM users LIMIT :n", n=user_site_cache.max_size)
+    for uid, site, dob in rows:
+        user_site_cache.set(uid, site)
+        user_birth_date_cache.set(uid, dob)
+
+# (name, fn, required): required steps are retried until they succeed, the
+# others until WARMUP_TIMEOUT, after which the worker is ready without them
+WARMUP_STEPS = [
+    ('database', lambda: db_pool.warm(WARMUP_DB_CONNECTIONS), True),
+    ('replicas', warm_up_replicas, False),
+    ('dynamodb', lambda: query_latest_dynamo_features(WARMUP_USER_ID), False),
+    ('model', warm_up_model, False),
+    ('caches', prime_caches, False),
+]
+
+warmup_status = {name: 'pending' for name, _, _ in WARMUP_STEPS}
+worker_ready = False
+# Pids of the ready workers, one slot per worker; shared by the forked workers
+# (created before fork). The master clears the slot of a worker that exits
+# (gunicorn_conf.py child_exit), so a killed worker does not stay counted.
+ready_slots = multiprocessing.Array('i', SERVER_WORKERS)
+
+def mark_ready(pid):
+    with ready_slots.get_lock():
+        if pid in ready_slots:
+            return
+        for i, slot in enumerate(ready_slots):
+            if slot == 0:
+                ready_slots[i] = pid
+                return
+
+def clear_ready(pid):
+    with ready_slots.get_lock():
+        for i, slot in enumerate(ready_slots):
+            if slot == pid:
+                ready_slots[i] = 0
+
+def ready_worker_count():
+    with ready_slots.get_lock():
+        return sum(1 for slot in ready_slots if slot)
+
+def warm_up():
+    global worker_ready
+    deadline = time.monotonic() + WARMUP_TIMEOUT
+    pending = list(WARMUP_STEPS)
+    while pending:
+        for step in list(pending):
+            name, fn, required = step
+            start = time.perf_counter()
+            try:
+                fn()
+            except Exception as e:
+                warmup_status[name] = f"failed: {e}"
+                if required or time.monotonic() < deadline:
+                    continue
+                print(f"Warm-up step '{name}' skipped: {e}")
+            else:
+                warmup_status[name] = f"ok ({(time.perf_counter() - start) * 1000:.0f} ms)"
+            pending.remove(step)
+        if pending:
+            time.sleep(2)
+    worker_ready = True
+    mark_ready(os.getpid())
+    print(f"Worker {os.getpid()} ready: {warmup_status}")
+
+registry.gauge('cpms_ready', lambda: {(): int(worker_ready)}, 'Whether this worker finished its warm-up')
+
+@app.on_event("startup")
+def start_warm_up():
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+
+@app.on_event("shutdown")
+def leave_ready_set():
+    global worker_ready
+    if worker_ready:
+        worker_ready = False
+        clear_ready(os.getpid())
+
 # --- ROUTES ---
 
 @app.get("/health")
 def health():
+    """Liveness: the process is up (it may still be warming up, see /ready)."""
     return {"status": "healthy"}
 
+@app.get("/ready")
+def ready():
+    """Readiness for the load balancer: 503 until every worker has warmed up."""
+    workers_ready = ready_worker_count()
+    body = {
+        "ready": worker_ready and workers_ready >= SERVER_WORKERS,
+        "workers_ready": workers_ready,
+        "workers": SERVER_WORKERS,
+        "warmup": warmup_status,
+    }
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text format: per-stage and per-route latency histograms.
+
+    Summed over all worker processes; gauges get one series per worker.
+    """
+    return shared_metrics.render() if shared_metrics else registry.render()
+
 @app.get("/api/worker/{user_id}/status")
 def get_worker_status(user_id: str):
     """Used by Worker App to show 'Last Pulse' before filling form"""
     features = get_latest_dynamo_features(user_id)
-    return {
+    return FastJSONResponse({
         "user_id": user_id,
         "last_heart_rate": int(features.get('heart_rate', 0)),
         "last_steps": int(features.get('steps', 0)),
         "timestamp": features.get('timestamp')
+    })
+
+@app.get("/api/site/{site_id}/status")
+def get_site_status(site_id: str):
+    """'Last pulse' of every worker of a site in one response.
+
+    Columnar payload: one array per field, aligned by index with user_id.
+    Workers without live data have null values.
+    """
+    try:
+        user_ids = get_site_user_ids(site_id)
+        with span('features'):
+            features = get_latest_dynamo_features_batch(user_ids, fallback=False)
+    except Exception as e:
+        print(f"Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    def column(name, cast=None):
+        values = []
+        for uid in user_ids:
+            value = features.get(uid, {}).get(name)
+            values.append(cast(value) if cast and value is not None else value)
+        return values
+
+    return FastJSONResponse({
+        "site_id": site_id,
+        "user_id": user_ids,
+        "last_heart_rate": column('heart_rate', int),
+        "last_steps": column('steps', int),
+        "timestamp": column('timestamp'),
+    })
+
+def load_raw_history(conn, user_id, from_ts, to_ts):
+    scores = conn.run(
+        """SELECT timestamp, cognitive_score FROM cognitive_scores
+           WHERE user_id = :uid AND timestamp >= :from_ts AND timestamp < :to_ts
+           ORDER BY timestamp""",
+        uid=user_id, from_ts=from_ts, to_ts=to_ts
+    )
+    heart_rates = conn.run(
+        """SELECT timestamp, heart_rate FROM tracking_risks
+           WHERE user_id = :uid AND timestamp >= :from_ts AND timestamp < :to_ts
+               AND heart_rate IS NOT NULL
+           ORDER BY timestamp""",
+        uid=user_id, from_ts=from_ts, to_ts=to_ts
+    )
+    return scores, heart_rates
+
+def load_hourly_history(conn, user_id, from_ts, to_ts):
+    """Hourly averages up to the rollup watermark, raw rows after it."""
+    watermark = conn.run("SELECT last_ts FROM rollup_watermarks WHERE name = 'hourly'")[0][0]
+    rows = conn.run(
+        """SELECT hour, score_count, score_sum, hr_count, hr_sum FROM user_hourly_rollups
+           WHERE user_id = :uid AND hour >= :from_ts AND hour < LEAST(:to_ts, :watermark)
+           ORDER BY hour""",
+        uid=user_id, from_ts=from_ts, to_ts=to_ts, watermark=watermark
+    )
+    scores = [(r[0], float(r[2]) / r[1]) for r in rows if r[1]]
+    heart_rates = [(r[0], float(r[4]) / r[3]) for r in rows if r[3]]
+    if watermark < to_ts:
+        tail_scores, tail_hrs = load_raw_history(conn, user_id, max(from_ts, watermark), to_ts)
+        scores += tail_scores
+        heart_rates += tail_hrs
+    return scores, heart_rates
+
+EPOCH = datetime(1970, 1, 1)
+
+def to_naive_utc(dt):
+    """Timestamps are stored as naive UTC; accept both naive and aware input."""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+def downsampled_series(rows, points):
+    sampled = lttb([((ts - EPOCH).total_seconds(), float(v)) for ts, v in rows], points)
+    return {
+        "t": [(EPOCH + timedelta(seconds=x)).isoformat() for x, _ in sampled],
+        "v": [round(y, 1) for _, y in sampled],
     }
 
-@app.post("/api/predict")
+@app.get("/api/worker/{user_id}/history")
+def get_worker_history(
+    user_id: str,
+    from_ts: datetime = Query(..., alias="from"),
+    to_ts: datetime = Query(..., alias="to"),
+    points: int = Query(500, ge=3, le=HISTORY_MAX_POINTS),
+):
+    """Score and heart-rate history, at most `points` points per series.
+
+    Short ranges use raw rows, long ones the hourly rollups; either way the
+    series is downsampled with LTTB so peaks and dips survive.
+    """
+    from_ts, to_ts = to_naive_utc(from_ts), to_naive_utc(to_ts)
+    raw = (to_ts - from_ts) <= timedelta(days=HISTORY_RAW_MAX_DAYS)
+    try:
+        with db_read_connection() as conn:
+            if raw:
+                scores, heart_rates = load_raw_history(conn, user_id, from_ts, to_ts)
+            else:
+                scores, heart_rates = load_hourly_history(conn, user_id, from_ts, to_ts)
+    except Exception as e:
+        print(f"Db Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return FastJSONResponse({
+        "user_id": user_id,
+        "resolution": "raw" if raw else "hourly",
+        "score": downsampled_series(scores, points),
+        "heart_rate": downsampled_series(heart_rates, points),
+    })
+
+@app.post("/api/predict", response_model=PredictResponse)
 def predict_readiness(req: PredictRequest):
+    birth_dates = get_known_birth_dates([req.user_id])
     try:
         # 1. Fetch Aggregates (Live Wearable Data)
         features = get_latest_dynamo_features(req.user_id)
-        
+
         # 2. Merge Manual Form Data with Live Data
-        # We convert the Pydantic model to a dict and merge
-        model_input = features.copy()
-        model_input.update(req.dict())
-
-        # 3. Call SageMaker
-        payload = json.dumps(model_input, default=str)
-        sm_resp = sagemaker_runtime.invoke_endpoint(
-            EndpointName=ENDPOINT_NAME,
-            ContentType='application/json',
-            Body=payload
-        )
-        result = json.loads(sm_resp['Body'].read().decode())
+        model_input = build_model_input(features, req, {'date_of_birth': birth_dates.get(req.user_id)})
+
+        # 3. Call SageMaker (batched together with concurrent requests)
+        result = predict_one(model_input)
         score = result.get('cognitive_score', 0)
 
-        # 4. Save Result to Postgres
+        # 4. Save Result to Postgres (fallback answers are only returned, they
+        # would count a stale or stand-in score in the history and stats)
         status = 'Critical' if score < 50 else 'Normal'
-        conn = get_db_conn()
-        cs_id = str(uuid.uuid4())
-        
-        # We also save the 'snapshot' of heart rate at this moment into tracking_risks 
-        # (This logic mimics the 'TrackingRisk' table population in your report)
-        tr_id = str(uuid.uuid4())
-        conn.run(
-            """INSERT INTO tracking_risks 
-               (tr_id, user_id, timestamp, heart_rate, risk_metric, steps, distance, calories) 
-               VALUES (:id, :uid, NOW(), :hr, :risk, :steps, 0, 0)""",
-            id=tr_id, uid=req.user_id, hr=int(features.get('heart_rate', 0)), 
-            risk=status, steps=int(features.get('steps', 0))
-        )
+        if 'fallback' not in result:
+            with span('persist'):
+                persist_scores([build_score_row(req.user_id, features, score, status)])
 
-        conn.run(
-            "INSERT INTO cognitive_scores (cs_id, user_id, timestamp, cognitive_score) VALUES (:id, :uid, NOW(), :score)",
-            id=cs_id, uid=req.user_id, score=score
-        )
-        conn.close()
-
-        return {"user_id": req.user_id, "score": score, "status": status}
+        return FastJSONResponse({"user_id": req.user_id, "score": score, "status": status,
+                                 **fallback_fields(result)})
 
     except Exception as e:
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/dashboard/stats")
-def get_dashboard_stats():
+@app.post("/api/predict/batch", response_model=BatchPredictResponse)
+def predict_readiness_batch(batch: BatchPredictRequest):
+    """Pre-shift check of a whole crew: one BatchGetItem pass, one model call, one insert."""
+    if len(batch.requests) > MAX_BATCH_PREDICT:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_PREDICT} requests per batch")
+    if not batch.requests:
+        return {"results": []}
+    birth_dates = get_known_birth_dates([r.user_id for r in batch.requests])
     try:
-        conn = get_db_conn()
-        
+        with span('features'):
+            features = get_latest_dynamo_features_batch([r.user_id for r in batch.requests])
+        model_inputs = [build_model_input(features[r.user_id], r, {'date_of_birth': birth_dates.get(r.user_id)})
+                        for r in batch.requests]
+
+        predictions = predict_many(model_inputs)
+
+        rows, results = [], []
+        for req, prediction in zip(batch.requests, predictions):
+            if isinstance(prediction, Exception):
+                # Nothing to answer with for this user; the others still get scored
+                results.append({"user_id": req.user_id, "score": None, "status": "Unavailable",
+                                "error": str(prediction)})
+                continue
+            score = prediction.get('cognitive_score', 0)
+            status = 'Critical' if score < 50 else 'Normal'
+            if 'fallback' not in prediction:
+                rows.append(build_score_row(req.user_id, features[req.user_id], score, status))
+            results.append({"user_id": req.user_id, "score": score, "status": status,
+                            **fallback_fields(prediction)})
+        persist_scores(rows)
+
+        return FastJSONResponse({"results": results})
+
+    except Exception as e:
+        print(f"Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def load_dashboard_stats():
+    with db_read_connection() as conn:
         # Fetch Scores + Join with latest Heart Rate (via Tracking Risks table)
         query = """
             SELECT 
@@ -150,28 +1237,215 @@ def get_dashboard_stats():
         """
         rows = conn.run(query)
         
-        # Get Stats
-        risk_count = conn.run("SELECT COUNT(*) FROM cognitive_scores WHERE cognitive_score < 50")[0][0]
-        avg_score = conn.run("SELECT AVG(cognitive_score) FROM cognitive_scores")[0][0]
+        # Get Stats from the daily summary (O(days x sites), not O(scores))
+        risk_count, score_sum, score_count = conn.run(
+            """SELECT COALESCE(SUM(critical_count), 0), SUM(score_sum), SUM(score_count)
+               FROM score_daily_stats"""
+        )[0]
+        avg_score = score_sum / score_count if score_count else None
+
+    data = []
+    for r in rows:
+        data.append({
+            "user_id": r[0],
+            "score": r[1],
+            "timestamp": str(r[2]),
+            "heart_rate": r[3] if r[3] else 0,
+            "status": "Critical" if r[1] < 50 else "Normal"
+        })
         
-        conn.close()
-
-        data = []
-        for r in rows:
-            data.append({
-                "user_id": r[0],
-                "score": r[1],
-                "timestamp": str(r[2]),
-                "heart_rate": r[3] if r[3] else 0,
-                "status": "Critical" if r[1] < 50 else "Normal"
-            })
-            
-        return {
-            "recent_checks": data, 
-            "critical_alerts": risk_count,
-            "avg_score": int(avg_score) if avg_score else 0
-        }
+    return {
+        "recent_checks": data, 
+        "critical_alerts": risk_count,
+        "avg_score": int(avg_score) if avg_score else 0
+    }
+
+def encoded_dashboard_stats():
+    """Cached already encoded: every viewer gets the same bytes."""
+    return dumps(load_dashboard_stats())
+
+@app.get("/api/dashboard/stats")
+def get_dashboard_stats():
+    try:
+        return FastJSONResponse(dashboard_cache.get_or_load('stats', encoded_dashboard_stats))
+
+    except Exception as e:
+        print(f"Db Error: {e}")
+        return {"recent_checks": [], "critical_alerts": 0, "avg_score": 0}
 
+
+# --- LIVE UPDATES (server-sent events) ---
+
+@app.get("/api/dashboard/events")
+async def dashboard_events(request: Request, site_id: Optional[str] = None):
+    """Server-sent events: 'score', 'alert' and 'pulse' as they happen.
+
+    Pass site_id to only receive one site. Events for the same user are
+    coalesced while a client is behind, so slow viewers get the latest state.
+    """
+    sub = broadcaster.subscribe(site_id)
+    return StreamingResponse(
+        broadcaster.stream(sub, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/api/stream/pulses")
+def push_pulses(batch: PulseBatch, x_stream_token: Optional[str] = Header(None)):
+    """Called by the stream processor with the latest wearable state per user."""
+    if not STREAM_PUSH_TOKEN or x_stream_token != STREAM_PUSH_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid stream token")
+    # Fresh state straight from the stream, no need to ask DynamoDB again
+    for u in batch.updates:
+        feature_cache.set(u.user_id, u.dict())
+    if MULTI_WORKER or len(broadcaster):
+        sites = get_user_sites([u.user_id for u in batch.updates])
+        events = []
+        for u in batch.updates:
+            event = dict(u.dict(exclude={'hr_recent'}), type="pulse", site_id=sites.get(u.user_id))
+            events.append((("pulse", u.user_id), event, event['site_id']))
+        publish_events(events)
+    return {"received": len(batch.updates)}
+
+# --- ANALYTICS (hourly rollups) ---
+
+ANALYTICS_GROUPS = {
+    "hour": "hour",
+    "day": "date_trunc('day', hour)",
+    "site": "site_id",
+    "team": "team_id",
+}
+
+@app.get("/api/analytics")
+def get_analytics(
+    from_ts: datetime = Query(..., alias="from"),
+    to_ts: datetime = Query(..., alias="to"),
+    group_by: str = Query("day", regex="^(hour|day|site|team)$"),
+    site_id: Optional[str] = None,
+    team_id: Optional[str] = None,
+):
+    """Average score, critical rate and heart rate over [from, to).
+
+    Served from score_hourly_rollups, so a year is at most ~8,760 rows per
+    site and team whatever the raw tables hold. Data is complete up to
+    'as_of' (the rollup watermark).
+    """
+    conditions = ["hour >= date_trunc('hour', CAST(:from_ts AS TIMESTAMP))", "hour < :to_ts"]
+    params = {"from_ts": to_naive_utc(from_ts), "to_ts": to_naive_utc(to_ts)}
+    if site_id:
+        conditions.append("site_id = :site_id")
+        params["site_id"] = site_id
+    if team_id:
+        conditions.append("team_id = :team_id")
+        params["team_id"] = team_id
+    group = ANALYTICS_GROUPS[group_by]
+    query = f"""
+        SELECT {group} AS bucket, SUM(score_count), SUM(score_sum), SUM(critical_count),
+               SUM(hr_count), SUM(hr_sum), MAX(hr_max)
+        FROM score_hourly_rollups
+        WHERE {" AND ".join(conditions)}
+        GROUP BY 1 ORDER BY 1
+    """
+    try:
+        with db_read_connection() as conn:
+            rows = conn.run(query, **params)
+            as_of = conn.run("SELECT last_ts FROM rollup_watermarks WHERE name = 'hourly'")[0][0]
+    except Exception as e:
+        print(f"Db Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    series = []
+    for bucket, checks, score_sum, critical, hr_count, hr_sum, hr_max in rows:
+        series.append({
+            group_by: str(bucket),
+            "checks": int(checks),
+            "avg_score": round(float(score_sum) / checks, 1) if checks else None,
+            "critical_rate": round(float(critical) / checks, 4) if checks else None,
+            "avg_heart_rate": round(float(hr_sum) / hr_count, 1) if hr_count else None,
+            "max_heart_rate": hr_max,
+        })
+    return {"group_by": group_by, "as_of": str(as_of), "series": series}
+
+# --- RECENT CHECKS (keyset pagination) ---
+
+def encode_cursor(timestamp, cs_id):
+    raw = json.dumps([timestamp.isoformat(), cs_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(cursor):
+    try:
+        ts, cs_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(ts), cs_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/api/dashboard/checks")
+def get_dashboard_checks(
+    user_id: Optional[str] = None,
+    status: Optional[str] = Query(None, regex="^(Critical|Normal)$"),
+    min_score: Optional[int] = None,
+    max_score: Optional[int] = None,
+    from_ts: Optional[datetime] = Query(None, alias="from"),
+    to_ts: Optional[datetime] = Query(None, alias="to"),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+):
+    """Newest-first checks, paged on (timestamp, cs_id) instead of OFFSET.
+
+    Every page is an index range scan starting right after the previous
+    page's last row, so page N costs the same as page 1.
+    """
+    conditions = []
+    params = {"limit": limit + 1}
+    if user_id:
+        conditions.append("cs.user_id = :user_id")
+        params["user_id"] = user_id
+    if status == "Critical":
+        conditions.append("cs.cognitive_score < 50")
+    elif status == "Normal":
+        conditions.append("cs.cognitive_score >= 50")
+    if min_score is not None:
+        conditions.append("cs.cognitive_score >= :min_score")
+        params["min_score"] = min_score
+    if max_score is not None:
+        conditions.append("cs.cognitive_score <= :max_score")
+        params["max_score"] = max_score
+    if from_ts:
+        conditions.append("cs.timestamp >= :from_ts")
+        params["from_ts"] = to_naive_utc(from_ts)
+    if to_ts:
+        conditions.append("cs.timestamp < :to_ts")
+        params["to_ts"] = to_naive_utc(to_ts)
+    if cursor:
+        params["cur_ts"], params["cur_id"] = decode_cursor(cursor)
+        conditions.append("(cs.timestamp, cs.cs_id) < (:cur_ts, :cur_id)")
+
+    query = f"""
+        SELECT cs.cs_id, cs.user_id, cs.cognitive_score, cs.timestamp, tr.heart_rate
+        FROM cognitive_scores cs
+        LEFT JOIN tracking_risks tr ON tr.user_id = cs.user_id
+            AND tr.timestamp = cs.timestamp
+        {"WHERE " + " AND ".join(conditions) if conditions else ""}
+        ORDER BY cs.timestamp DESC, cs.cs_id DESC
+        LIMIT :limit
+    """
+    try:
+        with db_read_connection() as conn:
+            rows = conn.run(query, **params)
     except Exception as e:
         print(f"Db Error: {e}")
-        return {"recent_checks": [], "critical_alerts": 0, "avg_score": 0}
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+    page = rows[:limit]
+    next_cursor = encode_cursor(page[-1][3], page[-1][0]) if len(rows) > limit else None
+    return {
+        "checks": [{
+            "cs_id": r[0],
+            "user_id": r[1],
+            "score": r[2],
+            "timestamp": str(r[3]),
+            "heart_rate": r[4] if r[4] else 0,
+            "status": "Critical" if r[2] < 50 else "Normal"
+        } for r in page],
+        "next_cursor": next_cursor
+    }
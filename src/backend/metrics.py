@@ -0,0 +1,289 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Upper bounds in seconds, from sub-millisecond cache hits to cold starts
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Stage durations of the request being handled, for the Server-Timing header
+_request_timings = ContextVar('request_timings', default=None)
+
+
+class Histogram:
+    """Prometheus-style histogram; observe() is a bisect and an increment."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q):
+        """Approximate quantile (upper bound of the bucket it falls in)."""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if not total:
+            return None
+        rank, seen = q * total, 0
+        for bound, n in zip(self.buckets + (float('inf'),), counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Registry:
+    def __init__(self):
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._counters = {}    # (name, labels) -> value
+        self._gauges = {}      # name -> callable returning {labels: value}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, help_text='', **labels):
+        key = (name, tuple(sorted(labels.items())))
+        hist = self._histograms.get(key)
+        if hist is None:
+            with self._lock:
+                hist = self._histograms.setdefault(key, Histogram())
+                self._help.setdefault(name, help_text)
+        return hist
+
+    def inc(self, name, value=1, help_text='', **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            self._help.setdefault(name, help_text)
+
+    def gauge(self, name, fn, help_text=''):
+        """Registers fn() -> {labels_tuple: value}, evaluated on scrape."""
+        with self._lock:
+            self._gauges[name] = fn
+            self._help[name] = help_text
+
+    def snapshot(self):
+        """Plain copy of every series (gauges evaluated now)."""
+        with self._lock:
+            histograms = list(self._histograms.items())
+            counters = dict(self._counters)
+            gauges = list(self._gauges.items())
+            help_texts = dict(self._help)
+        snap = {'help': help_texts, 'histograms': {}, 'counters': counters, 'gauges': {}}
+        for key, hist in histograms:
+            with hist._lock:
+                snap['histograms'][key] = (hist.buckets, list(hist.counts), hist.sum, hist.count)
+        for name, fn in gauges:
+            snap['gauges'][name] = dict(fn())
+        return snap
+
+    def render(self):
+        """Prometheus text exposition format."""
+        return render(self.snapshot())
+
+
+def render(snap):
+    """Prometheus text exposition format of a snapshot."""
+    lines = []
+
+    def fmt(labels):
+        return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}' if labels else ''
+
+    def header(name, kind):
+        if snap['help'].get(name):
+            lines.append(f"# HELP {name} {snap['help'][name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    seen = set()
+    for (name, labels), (buckets, counts, total, count) in sorted(snap['histograms'].items()):
+        if name not in seen:
+            header(name, 'histogram')
+            seen.add(name)
+        cumulative = 0
+        for bound, n in zip(tuple(buckets) + (float('inf'),), counts):
+            cumulative += n
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f"{name}_bucket{fmt(labels + (('le', le),))} {cumulative}")
+        lines.append(f"{name}_sum{fmt(labels)} {total}")
+        lines.append(f"{name}_count{fmt(labels)} {count}")
+    for (name, labels), value in sorted(snap['counters'].items()):
+        if name not in seen:
+            header(name, 'counter')
+            seen.add(name)
+        lines.append(f"{name}{fmt(labels)} {value}")
+    for name, series in sorted(snap['gauges'].items()):
+        header(name, 'gauge')
+        for labels, value in sorted(series.items()):
+            lines.append(f"{name}{fmt(labels)} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+def _labels(pairs):
+    return tuple((k, v) for k, v in pairs)
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SharedMetrics:
+    """/metrics over all worker processes of a server, whichever one is scraped.
+
+    Every process writes a snapshot of its registry to `<directory>/<pid>.json`
+    every `interval` seconds, and the scraped one right before reading them.
+    Histograms and counters are summed over all files, including those of
+    workers that exited, so counters never go backwards. Gauges describe a
+    process (queue depth, connected dashboards...): they keep one series per
+    live worker, labelled worker="<pid>".
+    """
+
+    def __init__(self, registry, directory, interval=5.0):
+        self.registry = registry
+        self.directory = directory
+        self.interval = interval
+        self._started = False
+
+    def reset(self):
+        """Starts a server from zero; call it before the workers are forked."""
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                os.remove(os.path.join(self.directory, name))
+
+    def start(self):
+        if not self._started:
+            self._started = True
+            # A reused pid must not overwrite the counters of the worker that had it
+            path = os.path.join(self.directory, f"{os.getpid()}.json")
+            if os.path.exists(path):
+                os.replace(path, os.path.join(self.directory, f"exited-{time.time_ns()}.json"))
+            threading.Thread(target=self._loop, name='metrics-writer', daemon=True).start()
+
+    def _loop(self):
+        while True:
+            try:
+                self.write()
+            except Exception as e:
+                print(f"Writing metrics failed: {e}")
+            time.sleep(self.interval)
+
+    def write(self):
+        snap = self.registry.snapshot()
+        data = {
+            'help': snap['help'],
+            'histograms': [[name, labels, buckets, counts, total, count]
+                           for (name, labels), (buckets, counts, total, count) in snap['histograms'].items()],
+            'counters': [[name, labels, value] for (name, labels), value in snap['counters'].items()],
+            'gauges': [[name, labels, value] for name, series in snap['gauges'].items()
+                       for labels, value in series.items()],
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        with open(path + '.tmp', 'w') as f:
+            json.dump(data, f)
+        os.replace(path + '.tmp', path)
+
+    def collect(self):
+        """Snapshot merged over every worker's file."""
+        merged = {'help': {}, 'histograms': {}, 'counters': {}, 'gauges': {}}
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith('.json'):
+                continue
+            pid = name[:-len('.json')]
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            merged['help'].update(data['help'])
+            for metric, labels, buckets, counts, total, count in data['histograms']:
+                key = (metric, _labels(labels))
+                if key in merged['histograms']:
+                    _, seen_counts, seen_total, seen_count = merged['histograms'][key]
+                    counts = [a + b for a, b in zip(seen_counts, counts)]
+                    total, count = seen_total + total, seen_count + count
+                merged['histograms'][key] = (buckets, counts, total, count)
+            for metric, labels, value in data['counters']:
+                key = (metric, _labels(labels))
+                merged['counters'][key] = merged['counters'].get(key, 0) + value
+            if not pid.isdigit() or not _is_alive(int(pid)):
+                continue
+            for metric, labels, value in data['gauges']:
+                series = merged['gauges'].setdefault(metric, {})
+                series[_labels(labels) + (('worker', int(pid)),)] = value
+        return merged
+
+    def render(self):
+        self.write()
+        return render(self.collect())
+
+
+registry = Registry()
+
+
+@contextmanager
+def span(stage):
+    """Times a block as `stage`: histogram + Server-Timing of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.histogram('cpms_stage_duration_seconds', 'Duration of backend stages', stage=stage).observe(elapsed)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+
+class TimingMiddleware:
+    """ASGI middleware: request duration histogram and Server-Timing header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        timings = []
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message['type'] == 'http.response.start':
+                total = time.perf_counter() - start
+                parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings]
+                parts.append(f"total;dur={total * 1000:.1f}")
+                headers = list(message.get('headers', []))
+                headers.append((b'server-timing', ', '.join(parts).encode()))
+                message = dict(message, headers=headers)
+                endpoint = scope.get('endpoint')
+                route = getattr(endpoint, '__name__', 'unmatched')
+                registry.histogram('cpms_request_duration_seconds', 'Time to response start per route',
+                                   route=route).observe(total)
+                registry.inc('cpms_responses_total', help_text='Responses per route and status',
+                             route=route, status=message['status'])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
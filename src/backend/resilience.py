@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency that is currently failing."""
+
+
+class LatencyTracker:
+    """Rolling window of recent call latencies with a cached percentile."""
+
+    def __init__(self, size=256, percentile=0.95, recompute_every=16):
+        self.percentile = percentile
+        self.recompute_every = recompute_every
+        self._samples = deque(maxlen=size)
+        self._since_recompute = 0
+        self._value = None
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self._since_recompute += 1
+            if self._value is None or self._since_recompute >= self.recompute_every:
+                ordered = sorted(self._samples)
+                self._value = ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))]
+                self._since_recompute = 0
+
+    def value(self):
+        return self._value
+
+
+class CircuitBreaker:
+    """Opens when the error rate over the last `window` seconds crosses a threshold.
+
+    While open, allow() is False for `open_seconds`; then a single trial call
+    is let through (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, error_threshold=0.5, min_calls=10, window=30.0, open_seconds=10.0):
+        self.error_threshold = error_threshold
+        self.min_calls = min_calls
+        self.window = window
+        self.open_seconds = open_seconds
+        self.state = 'closed'
+        self.opened = 0
+        self._outcomes = deque()  # (time, ok)
+        self._open_until = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() >= self._open_until:
+                self.state = 'half-open'
+            if self.state == 'half-open' and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record(self, ok):
+        now = time.monotonic()
+        with self._lock:
+            if self.state == 'half-open':
+                self._trial_running = False
+                if ok:
+                    self.state = 'closed'
+                    self._outcomes.clear()
+                else:
+                    self._trip(now)
+                return
+            self._outcomes.append((now, ok))
+            while self._outcomes and self._outcomes[0][0] < now - self.window:
+                self._outcomes.popleft()
+            failures = sum(1 for _, success in self._outcomes if not success)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.error_threshold:
+                self._trip(now)
+
+    def _trip(self, now):
+        self.state = 'open'
+        self.opened += 1
+        self._open_until = now + self.open_seconds
+        self._outcomes.clear()
+
+
+class ResilientCaller:
+    """Wraps a remote call with hedging and a circuit breaker.
+
+    If the first attempt has not returned after the recent p95 latency
+    (bounded by min/max_hedge_delay), one duplicate is sent and whichever
+    succeeds first wins. Hedges are capped at `hedge_budget` of all calls so a
+    slow dependency is not hit with twice the load.
+    """
+
+    def __init__(self, fn, breaker=None, hedge=True, min_hedge_delay=0.05,
+                 max_hedge_delay=2.0, hedge_budget=0.1, max_workers=32):
+        self.fn = fn
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge = hedge
+        self.min_hedge_delay = min_hedge_delay
+        self.max_hedge_delay = max_hedge_delay
+        self.hedge_budget = hedge_budget
+        self.latency = LatencyTracker()
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedge')
+        self._lock = threading.Lock()
+
+    def hedge_delay(self):
+        p95 = self.latency.value()
+        if p95 is None:
+            return self.max_hedge_delay
+        return min(self.max_hedge_delay, max(self.min_hedge_delay, p95))
+
+    def _timed(self, *args):
+        start = time.perf_counter()
+        result = self.fn(*args)
+        self.latency.observe(time.perf_counter() - start)
+        return result
+
+    def _may_hedge(self):
+        with self._lock:
+            if self.hedge and self.hedges < self.hedge_budget * self.calls:
+                self.hedges += 1
+                return True
+            return False
+
+    def call(self, *args):
+        if not self.breaker.allow():
+            raise CircuitOpenError("Model endpoint circuit is open")
+        with self._lock:
+            self.calls += 1
+        primary = self._pool.submit(self._timed, *args)
+        pending = {primary}
+        done, _ = wait(pending, timeout=self.hedge_delay())
+        if not done and self._may_hedge():
+            pending.add(self._pool.submit(self._timed, *args))
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self.hedge_wins += 1
+                    self.breaker.record(True)
+                    return future.result()
+                error = future.exception()
+        self.breaker.record(False)
+        raise error
@@ -0,0 +1,82 @@
+import json
+import operator
+from datetime import date, datetime
+from decimal import Decimal
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # stdlib fallback, e.g. for scripts run outside the container
+    orjson = None
+
+
+def to_number(value):
+    """DynamoDB returns numbers as Decimal; the model and clients want plain numbers."""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
+
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        return to_number(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    return str(obj)
+
+
+if orjson is not None:
+    def dumps(obj, sort_keys=False):
+        """Compact JSON as bytes; Decimals become numbers instead of strings."""
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+
+    loads = orjson.loads
+else:
+    def dumps(obj, sort_keys=False):
+        """Compact JSON as bytes; Decimals become numbers instead of strings."""
+        return json.dumps(obj, default=_default, sort_keys=sort_keys, separators=(',', ':')).encode()
+
+    loads = json.loads
+
+
+class FastJSONResponse(Response):
+    """JSON response rendered in one call.
+
+    Routes return it directly, so FastAPI skips jsonable_encoder and the
+    response_model validation (which then only documents the schema).
+    """
+
+    media_type = 'application/json'
+
+    def render(self, content):
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
+
+
+class FeatureBuilder:
+    """Maps the latest aggregates and a request model straight into the model input.
+
+    The layout is fixed once: `aggregate_fields` ({name: default}) come first,
+    then `request_fields`, read as attributes of the request in one
+    attrgetter call instead of copying the item and merging req.dict(), then
+    the optional `profile_fields` ({name: default}).
+    """
+
+    def __init__(self, request_fields, aggregate_fields, profile_fields=None):
+        request_fields = tuple(request_fields)
+        profile_fields = profile_fields or {}
+        self.keys = tuple(aggregate_fields) + request_fields + tuple(profile_fields)
+        self._aggregates = tuple(aggregate_fields.items())
+        self._profile = tuple(profile_fields.items())
+        getter = operator.attrgetter(*request_fields)
+        self._request = getter if len(request_fields) > 1 else (lambda req: (getter(req),))
+
+    def __call__(self, aggregates, req, profile=None):
+        values = [to_number(aggregates.get(name, default)) for name, default in self._aggregates]
+        values.extend(self._request(req))
+        if self._profile:
+            profile = profile or {}
+            values.extend(profile.get(name, default) for name, default in self._profile)
+        return dict(zip(self.keys, values))
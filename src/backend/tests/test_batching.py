@@ -0,0 +1,37 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from batching import MicroBatcher
+
+
+class MicroBatcherTest(unittest.TestCase):
+
+    def test_results_in_submit_order(self):
+        batcher = MicroBatcher(lambda items: [item * 2 for item in items], max_wait=0.01)
+        futures = [batcher.submit(i) for i in range(5)]
+        self.assertEqual([f.result(timeout=5) for f in futures], [0, 2, 4, 6, 8])
+
+    def test_exception_result_fails_only_its_item(self):
+        error = LookupError("no fallback")
+        batcher = MicroBatcher(lambda items: [error if item == 'b' else item for item in items], max_wait=0.05)
+        futures = {item: batcher.submit(item) for item in 'abc'}
+        self.assertEqual(futures['a'].result(timeout=5), 'a')
+        self.assertEqual(futures['c'].result(timeout=5), 'c')
+        with self.assertRaises(LookupError):
+            futures['b'].result(timeout=5)
+
+    def test_raising_batch_fn_fails_every_item(self):
+        def fail(items):
+            raise ConnectionError("endpoint down")
+
+        batcher = MicroBatcher(fail, max_wait=0.05)
+        futures = [batcher.submit(i) for i in range(3)]
+        for future in futures:
+            with self.assertRaises(ConnectionError):
+                future.result(timeout=5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import metrics
+from metrics import Registry, SharedMetrics
+
+
+class SharedMetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def worker(self, pid, requests, depth):
+        """A worker process' registry, written as `pid`."""
+        registry = Registry()
+        for _ in range(requests):
+            registry.inc('cpms_responses_total', route='predict', status=200)
+            registry.histogram('cpms_request_duration_seconds', route='predict').observe(0.003)
+        registry.gauge('cpms_write_behind_queue_depth', lambda: {(): depth})
+        shared = SharedMetrics(registry, self.tmp.name)
+        with mock.patch.object(metrics.os, 'getpid', return_value=pid):
+            shared.write()
+        return shared
+
+    def test_counters_and_histograms_are_summed_over_workers(self):
+        self.worker(os.getpid(), 2, 0)
+        scraped = self.worker(os.getppid(), 3, 0)
+        text = metrics.render(scraped.collect())
+        self.assertIn('cpms_responses_total{route="predict",status="200"} 5', text)
+        self.assertIn('cpms_request_duration_seconds_count{route="predict"} 5', text)
+        self.assertIn('cpms_request_duration_seconds_bucket{route="predict",le="0.005"} 5', text)
+
+    def test_gauges_keep_one_series_per_live_worker(self):
+        exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+        exited.wait()
+        self.worker(exited.pid, 4, 7)
+        scraped = self.worker(os.getpid(), 1, 3)
+        snap = scraped.collect()
+        self.assertEqual(snap['gauges']['cpms_write_behind_queue_depth'], {(('worker', os.getpid()),): 3})
+        # The exited worker's requests still count
+        self.assertEqual(snap['counters'][('cpms_responses_total', (('route', 'predict'), ('status', 200)))], 5)
+
+    def test_reset_starts_from_zero(self):
+        shared = self.worker(os.getpid(), 1, 0)
+        shared.reset()
+        self.assertEqual(shared.collect()['counters'], {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import resilience
+from resilience import CircuitBreaker, CircuitOpenError, ResilientCaller
+
+
+class FakeClock:
+    """Stands in for the time module in the breaker; advanced by hand."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class FakeEndpoint:
+    """Model call that sleeps the next of `delays` and answers with its call number."""
+
+    def __init__(self, delays, error=None):
+        self.delays = list(delays)
+        self.error = error
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, payload):
+        with self._lock:
+            n = self.calls
+            self.calls += 1
+        time.sleep(self.delays[min(n, len(self.delays) - 1)])
+        if self.error:
+            raise self.error
+        return n
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(resilience, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(error_threshold=0.5, min_calls=4, window=30.0, open_seconds=10.0)
+
+    def trip(self):
+        for ok in (True, False, True, False):
+            self.breaker.record(ok)
+
+    def test_trips_at_the_threshold(self):
+        for ok in (True, False, True):
+            self.breaker.record(ok)
+        self.assertEqual(self.breaker.state, 'closed')
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, 'open')
+        self.assertEqual(self.breaker.opened, 1)
+        self.assertFalse(self.breaker.allow())
+
+    def test_half_open_lets_one_trial_through(self):
+        self.trip()
+        self.clock.now += 10.0
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, 'half-open')
+        self.assertFalse(self.breaker.allow())
+
+    def test_successful_trial_closes(self):
+        self.trip()
+        self.clock.now += 10.0
+        self.breaker.allow()
+        self.breaker.record(True)
+        self.assertEqual(self.breaker.state, 'closed')
+        self.assertTrue(self.breaker.allow())
+
+    def test_failed_trial_reopens(self):
+        self.trip()
+        self.clock.now += 10.0
+        self.breaker.allow()
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, 'open')
+        self.assertEqual(self.breaker.opened, 2)
+        self.clock.now += 5.0
+        self.assertFalse(self.breaker.allow())
+
+
+class ResilientCallerTest(unittest.TestCase):
+
+    def make_caller(self, fn, **kwargs):
+        kwargs.setdefault('min_hedge_delay', 0.001)
+        kwargs.setdefault('max_hedge_delay', 0.02)
+        return ResilientCaller(fn, **kwargs)
+
+    def test_hedge_fires_after_the_delay_and_fast_duplicate_wins(self):
+        endpoint = FakeEndpoint([1.0, 0.0])
+        caller = self.make_caller(endpoint, hedge_budget=1.0)
+        start = time.monotonic()
+        self.assertEqual(caller.call(b'{}'), 1)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual((caller.hedges, caller.hedge_wins), (1, 1))
+
+    def test_no_hedge_when_the_first_attempt_is_fast(self):
+        endpoint = FakeEndpoint([0.0])
+        caller = self.make_caller(endpoint, hedge_budget=1.0, max_hedge_delay=1.0)
+        self.assertEqual(caller.call(b'{}'), 0)
+        self.assertEqual(caller.hedges, 0)
+
+    def test_budget_caps_hedges(self):
+        endpoint = FakeEndpoint([0.05])
+        caller = self.make_caller(endpoint, hedge_budget=0.5)
+        for _ in range(4):
+            caller.call(b'{}')
+        self.assertEqual(caller.calls, 4)
+        self.assertEqual(caller.hedges, 2)
+
+    def test_open_circuit_raises_without_calling(self):
+        endpoint = FakeEndpoint([0.0], error=ConnectionError("endpoint down"))
+        breaker = CircuitBreaker(error_threshold=0.5, min_calls=1, open_seconds=60.0)
+        caller = self.make_caller(endpoint, breaker=breaker, hedge=False)
+        with self.assertRaises(ConnectionError):
+            caller.call(b'{}')
+        start = time.monotonic()
+        with self.assertRaises(CircuitOpenError):
+            caller.call(b'{}')
+        self.assertLess(time.monotonic() - start, 0.01)
+        self.assertEqual(endpoint.calls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from write_behind import WriteBehindQueue
+
+
+class RejectedRow(Exception):
+    pass
+
+
+class FakeDatabase:
+    """flush_fn that records batches, or fails while `down` is set.
+
+    Like the multi-row insert, a batch holding a row with 'bad' set is
+    rejected as a whole.
+    """
+
+    def __init__(self):
+        self.rows = []
+        self.down = False
+
+    def __call__(self, batch):
+        if self.down:
+            raise ConnectionError("database down")
+        if any(row.get('bad') for row in batch):
+            raise RejectedRow("violates foreign key constraint")
+        self.rows.extend(batch)
+
+
+class WriteBehindQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.spill_path = os.path.join(self.tmp.name, "spill.jsonl")
+        self.db = FakeDatabase()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_queue(self, **kwargs):
+        kwargs.setdefault('batch_size', 10)
+        kwargs.setdefault('flush_interval', 0.001)
+        kwargs.setdefault('is_permanent_error', lambda e: isinstance(e, RejectedRow))
+        return WriteBehindQueue(self.db, spill_path=self.spill_path, **kwargs)
+
+    def spilled(self, path=None):
+        path = path or self.spill_path
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            return [json.loads(line) for line in f]
+
+    def wait_for(self, condition, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("condition not met in time")
+            time.sleep(0.01)
+
+    def test_stop_spills_every_queued_row(self):
+        q = self.make_queue(max_size=2000)
+        rows = [{'i': i} for i in range(1000)]
+        for row in rows:
+            q.put(row)
+        # Never started: everything is still queued
+        q.stop()
+        self.assertEqual(self.spilled(), rows)
+        self.assertEqual(q.qsize(), 0)
+
+    def test_full_queue_spills_instead_of_blocking(self):
+        q = self.make_queue(max_size=2)
+        for i in range(5):
+            q.put({'i': i})
+        self.assertEqual(self.spilled(), [{'i': 2}, {'i': 3}, {'i': 4}])
+
+    def test_failed_flush_spills_the_batch(self):
+        self.db.down = True
+        q = self.make_queue(replay_interval=60)
+        q.start()
+        try:
+            q.put({'i': 1})
+            self.wait_for(lambda: self.spilled() == [{'i': 1}])
+        finally:
+            q.stop()
+        self.assertEqual(self.db.rows, [])
+
+    def test_replay_on_start(self):
+        self.make_queue()._spill([{'i': i} for i in range(25)])
+        q = self.make_queue()
+        q.start()
+        q.stop()
+        self.assertEqual(self.db.rows, [{'i': i} for i in range(25)])
+        self.assertFalse(os.path.exists(self.spill_path))
+
+    def test_failed_replay_keeps_the_rows(self):
+        self.make_queue()._spill([{'i': 1}, {'i': 2}])
+        self.db.down = True
+        q = self.make_queue()
+        q.replay_spill()
+        self.assertEqual(self.spilled(), [{'i': 1}, {'i': 2}])
+        self.assertEqual([name for name in os.listdir(self.tmp.name)], ["spill.jsonl"])
+
+    def test_spilled_rows_replayed_after_database_recovers(self):
+        self.db.down = True
+        q = self.make_queue(replay_interval=0)
+        q.start()
+        try:
+            q.put({'i': 1})
+            self.wait_for(lambda: self.spilled() == [{'i': 1}])
+            # The next successful flush also writes the spilled row, no restart needed
+            self.db.down = False
+            q.put({'i': 2})
+            self.wait_for(lambda: sorted(r['i'] for r in self.db.rows) == [1, 2])
+        finally:
+            q.stop()
+        self.assertFalse(os.path.exists(self.spill_path))
+
+    def test_rejected_row_goes_to_dead_letter_and_the_rest_is_written(self):
+        q = self.make_queue(replay_interval=60)
+        q.start()
+        try:
+            for i in range(8):
+                q.put({'i': i, 'bad': i == 5})
+            self.wait_for(lambda: len(self.db.rows) == 7)
+        finally:
+            q.stop()
+        self.assertEqual(self.spilled(q.dead_letter_path), [{'i': 5, 'bad': True}])
+        self.assertEqual(self.spilled(), [])
+
+    def test_replay_does_not_stop_at_a_rejected_row(self):
+        self.make_queue()._spill([{'i': i, 'bad': i == 0} for i in range(25)])
+        q = self.make_queue()
+        q.replay_spill()
+        self.assertEqual(sorted(r['i'] for r in self.db.rows), list(range(1, 25)))
+        self.assertEqual(self.spilled(q.dead_letter_path), [{'i': 0, 'bad': True}])
+        self.assertFalse(os.path.exists(self.spill_path))
+
+    def test_failed_replay_keeps_only_the_unwritten_rows(self):
+        self.make_queue()._spill([{'i': i} for i in range(25)])
+        calls = []
+
+        def flaky(batch):
+            calls.append(batch)
+            if len(calls) > 1:
+                raise ConnectionError("database down")
+            self.db(batch)
+
+        q = WriteBehindQueue(flaky, batch_size=10, spill_path=self.spill_path)
+        q.replay_spill()
+        self.assertEqual(self.db.rows, [{'i': i} for i in range(10)])
+        self.assertEqual(self.spilled(), [{'i': i} for i in range(10, 25)])
+
+    def test_append_follows_a_spill_file_claimed_by_a_replay(self):
+        q = self.make_queue()
+        q._spill([{'i': 1}])
+        # Another process renamed the file after this one opened it
+        with open(self.spill_path, 'a') as f:
+            os.rename(self.spill_path, self.spill_path + ".replay-1")
+            self.assertFalse(q._is_current(f, self.spill_path))
+        q._spill([{'i': 2}])
+        self.assertEqual(self.spilled(), [{'i': 2}])
+        self.assertEqual(self.spilled(self.spill_path + ".replay-1"), [{'i': 1}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,190 @@
+import fcntl
+import json
+import os
+import queue
+import threading
+import time
+
+
+class WriteBehindQueue:
+    """Bounded in-process queue that persists rows in the background.
+
+    Producers call put() and return immediately. A daemon thread drains the
+    queue every `flush_interval` seconds (or as soon as `batch_size` rows are
+    waiting) and hands each batch to `flush_fn` as a single multi-row write.
+
+    Rows that cannot be written (queue full, database down, shutdown) are
+    appended to a local JSON-lines spill file. It is replayed on start and,
+    at most every `replay_interval` seconds, after a flush succeeds, so rows
+    spilled during a short outage reach the database without a restart. The
+    file only survives the process' host: put it on a persistent volume if
+    the rows must outlive a replaced container.
+
+    A batch that fails because of its rows rather than the database
+    (`is_permanent_error(e)` is true, e.g. a foreign key violation) is split
+    until the rejected rows are isolated: those are appended to
+    `dead_letter_path` and the rest of the batch is written. Several
+    processes may share both files; appends and the replay take an flock.
+    """
+
+    def __init__(self, flush_fn, max_size=10000, batch_size=500,
+                 flush_interval=0.005, spill_path='score_spill.jsonl', replay_interval=5.0,
+                 is_permanent_error=None, dead_letter_path=None):
+        self.flush_fn = flush_fn
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.replay_interval = replay_interval
+        self.is_permanent_error = is_permanent_error or (lambda e: False)
+        self.dead_letter_path = dead_letter_path or f"{spill_path}.dead"
+        self._next_replay = 0.0
+        self._queue = queue.Queue(maxsize=max_size)
+        self._spill_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.replay_spill()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    def put(self, row):
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            # Backpressure: never block the request, keep the row on disk instead
+            self._spill([row])
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        # Whatever the flusher did not get to goes to disk, batch by batch
+        while True:
+            batch = self._drain()
+            if not batch:
+                break
+            self._spill(batch)
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def _drain(self, first=None):
+        batch = [first] if first is not None else []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            # Give concurrent producers a moment to join this batch
+            if self._queue.qsize() < self.batch_size:
+                time.sleep(self.flush_interval)
+            batch = self._drain(first)
+            try:
+                self._write(batch)
+            except Exception as e:
+                print(f"Write-behind flush failed ({len(batch)} rows spilled): {e}")
+                self._spill(batch)
+            else:
+                self._retry_spill()
+
+    def _retry_spill(self):
+        """The database takes writes again: replay rows spilled meanwhile."""
+        now = time.monotonic()
+        if now < self._next_replay or not os.path.exists(self.spill_path):
+            return
+        self._next_replay = now + self.replay_interval
+        try:
+            self.replay_spill()
+        except Exception as e:
+            print(f"Spill replay failed: {e}")
+
+    def _write(self, rows):
+        """flush_fn(rows), moving the rows the database rejects to the dead-letter file.
+
+        Raises on a transient failure; rows written before it are skipped by
+        the primary keys on conflict when the batch is retried.
+        """
+        try:
+            self.flush_fn(rows)
+        except Exception as e:
+            if not self.is_permanent_error(e):
+                raise
+            if len(rows) == 1:
+                print(f"Write-behind row rejected, moved to {self.dead_letter_path}: {e}")
+                self._append(self.dead_letter_path, rows)
+                return
+            half = len(rows) // 2
+            self._write(rows[:half])
+            self._write(rows[half:])
+
+    def _spill(self, rows):
+        self._append(self.spill_path, rows)
+
+    def _append(self, path, rows):
+        if not rows:
+            return
+        # One write per batch: lines from several server processes sharing
+        # the file do not interleave
+        data = ''.join(json.dumps(row) + '\n' for row in rows)
+        with self._spill_lock:
+            while True:
+                with open(path, 'a') as f:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                    # A replay may have claimed the file while we waited for
+                    # the lock: append to the new one instead
+                    if not self._is_current(f, path):
+                        continue
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    return
+
+    @staticmethod
+    def _is_current(f, path):
+        try:
+            return os.stat(path).st_ino == os.fstat(f.fileno()).st_ino
+        except FileNotFoundError:
+            return False
+
+    def replay_spill(self):
+        """Re-submits rows left in the spill file by a previous run.
+
+        The file is renamed under its flock, so when several worker processes
+        start at once only one of them replays it, and appends from the
+        others go to a new spill file.
+        """
+        claimed = f"{self.spill_path}.replay-{os.getpid()}"
+        with self._spill_lock:
+            try:
+                f = open(self.spill_path)
+            except FileNotFoundError:
+                return
+            with f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                if not self._is_current(f, self.spill_path):
+                    return
+                os.rename(self.spill_path, claimed)
+                rows = [json.loads(line) for line in f if line.strip()]
+        rows_left = []
+        for i in range(0, len(rows), self.batch_size):
+            try:
+                self._write(rows[i:i + self.batch_size])
+            except Exception as e:
+                # Hand the rest back for the next attempt
+                print(f"Spill replay failed, keeping rows in {self.spill_path}: {e}")
+                rows_left = rows[i:]
+                break
+        self._spill(rows_left)
+        os.remove(claimed)
+        if not rows_left:
+            print(f"Replayed {len(rows)} spilled rows")
@@ -2,6 +2,7 @@ import base64
 import json
 import boto3
 import os
+import urllib.request
 from decimal import Decimal
 
 # Initialize DynamoDB client
@@ -9,6 +10,52 @@ dynamodb = boto3.resource('dynamodb')
 TABLE_NAME = os.environ['DYNAMO_TABLE']
 table = dynamodb.Table(TABLE_NAME)
 
+# Besides the time series, every user has one 'latest state' item under this
+# fixed sort key, so the backend can fetch many users with BatchGetItem
+LATEST_SORT_KEY = 'LATEST'
+
+# Heart-rate readings kept in the 'latest state' item for the model's rolling
+# stats (features.HR_WINDOW)
+HR_WINDOW = 12
+
+# Optional: push the latest state to the backend for live dashboards
+BACKEND_PUSH_URL = os.environ.get('BACKEND_PUSH_URL')  # e.g. http://<backend_url>/api/stream/pulses
+STREAM_PUSH_TOKEN = os.environ.get('STREAM_PUSH_TOKEN', '')
+
+def push_to_backend(user_updates):
+    """Best effort: dashboards miss a live pulse if this fails, DynamoDB still has it."""
+    body = json.dumps({'updates': list(user_updates.values())}, default=float).encode('utf-8')
+    req = urllib.request.Request(
+        BACKEND_PUSH_URL, data=body, method='POST',
+        headers={'Content-Type': 'application/json', 'X-Stream-Token': STREAM_PUSH_TOKEN}
+    )
+    try:
+        urllib.request.urlopen(req, timeout=2).close()
+    except Exception as e:
+        print(f"Failed to push updates to backend: {e}")
+
+def merge_recent_heart_rates(readings):
+    """Appends this batch's readings ({user_id: [hr, ...]}) to each user's stored window.
+
+    One BatchGetItem per 100 users reads the previous windows; returns
+    {user_id: [Decimal, ...]} with at most HR_WINDOW readings, oldest first.
+    """
+    stored = {}
+    user_ids = list(readings)
+    for i in range(0, len(user_ids), 100):
+        keys = [{'user_id': uid, 'timestamp': LATEST_SORT_KEY} for uid in user_ids[i:i + 100]]
+        request = {TABLE_NAME: {'Keys': keys, 'ProjectionExpression': 'user_id, hr_recent'}}
+        try:
+            while request:
+                resp = dynamodb.batch_get_item(RequestItems=request)
+                for item in resp['Responses'].get(TABLE_NAME, []):
+                    stored[item['user_id']] = item.get('hr_recent', [])
+                request = resp.get('UnprocessedKeys')
+        except Exception as e:
+            # The window restarts from this batch rather than dropping the update
+            print(f"Failed to read recent heart rates: {e}")
+    return {uid: (list(stored.get(uid, [])) + hrs)[-HR_WINDOW:] for uid, hrs in readings.items()}
+
 def lambda_handler(event, context):
     """
     Acts as the 'Spark Streaming' consumer.
@@ -18,6 +65,8 @@ def lambda_handler(event, context):
     
     # Batch processing to reduce DB writes (simple aggregation)
     user_updates = {}
+    # Every reading of the batch, in order, for the rolling heart-rate window
+    heart_rates = {}
 
     for record in event['Records']:
         try:
@@ -38,17 +87,25 @@ def lambda_handler(event, context):
                 'steps': Decimal(str(data.get('steps', 0))),
                 'calories': Decimal(str(data.get('calories', 0)))
             }
+            heart_rates.setdefault(user_id, []).append(user_updates[user_id]['heart_rate'])
             
         except Exception as e:
             print(f"Error decoding record: {e}")
 
+    recent = merge_recent_heart_rates(heart_rates) if heart_rates else {}
+
     # Write aggregated updates to DynamoDB
     # This matches the schema expected by your main.py backend
     for uid, stats in user_updates.items():
         try:
             print(f"Updating state for user {uid}: HR={stats['heart_rate']}")
             table.put_item(Item=stats)
+            stats['hr_recent'] = recent[uid]
+            table.put_item(Item=dict(stats, timestamp=LATEST_SORT_KEY, last_timestamp=stats['timestamp']))
         except Exception as e:
             print(f"Failed to write to DynamoDB: {e}")
 
+    if BACKEND_PUSH_URL and user_updates:
+        push_to_backend(user_updates)
+
     return f"Successfully processed {len(event['Records'])} records."
\ No newline at end of file
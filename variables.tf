@@ -1,3 +1,8 @@
 variable "project_name" {
   default = "cognitive-bigdata"
-}
\ No newline at end of file
+}
+
+# Read replicas of the user database; dashboard/analytics reads are routed to them
+variable "db_replica_count" {
+  default = 0
+}